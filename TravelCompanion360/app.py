@@ -1,7 +1,9 @@
 import os
+import hmac
+import functools
 from datetime import timedelta
 
-from flask import Flask, render_template, flash, redirect, url_for, session, request
+from flask import Blueprint, Flask, current_app, render_template, flash, redirect, url_for, session, request
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
@@ -10,64 +12,76 @@ import random
 import string
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
-
 # Initialize SQLAlchemy with a base class
 class Base(DeclarativeBase):
     pass
 
 from db import db  # Import db from the new db.py file
+from models import User, Hotel, CarRental, Booking
+from forms import LoginForm, RegistrationForm, HotelSearchForm, CarRentalForm
+from utils.hotel_search import find_hotels, save_recommendation
+from utils.maps_helper import get_coordinates, get_coordinates_batch
+from utils.booking import book_stay
+from utils.chat_history import get_conversation_id, load_conversation, save_conversation
+from utils.migrations import AUTO_MIGRATE, db_cli, upgrade
+from utils.room_archive import rooms_cli
+from utils.geocode_cache import geocode_cli
+from utils.session_store import ServerSideSessionInterface, create_session_backend, regenerate_session
+from utils import metrics, profiling
 
-# Create the Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET")
-
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///travel_companion.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)  # Set session to expire after 7 days
-
-# Initialize the app with the extension
-db.init_app(app)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 
 # Setup Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'warning'
 
-# Import models and forms after initializing db to avoid circular imports
-with app.app_context():
-    from models import User, Hotel, CarRental, Booking, RoomAvailability
-    from forms import LoginForm, RegistrationForm, HotelSearchForm, CarRentalForm
-    from utils.openai_helper import get_hotel_recommendations
-    from utils.maps_helper import get_coordinates
-
-    # Create database tables
-    db.create_all()
+# Every page and API route; registered on the app by create_app()
+main = Blueprint('main', __name__)
 
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
+# Longest window the availability views will show
+AVAILABILITY_MAX_DAYS = int(os.environ.get("AVAILABILITY_MAX_DAYS", "366"))
+
+# Emails of the users allowed to call the admin APIs, comma-separated
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()}
+# Most bookings one bulk cancellation may list by id
+BULK_CANCEL_LIMIT = int(os.environ.get("BULK_CANCEL_LIMIT", "10000"))
+# Bearer token Prometheus sends to scrape /metrics; without it only admins can read them
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+def is_admin():
+    return current_user.is_authenticated and current_user.email.lower() in ADMIN_EMAILS
+
+def admin_required(view):
+    """Only let users listed in ADMIN_EMAILS through"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        if not is_admin():
+            return {'error': 'Admin access required'}, 403
+        return view(*args, **kwargs)
+    return wrapper
+
 # Generate a random password with specified length
 def generate_random_password(length=12):
     characters = string.ascii_letters + string.digits + string.punctuation
     return ''.join(random.choice(characters) for _ in range(length))
 
 # Routes
-@app.route('/')
+@main.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     form = LoginForm()
     if form.validate_on_submit():
@@ -78,21 +92,23 @@ def login():
             user.password_hash = generate_password_hash(new_password)
             db.session.commit()
             
+            # A new session id, so one planted before login can't be used after it
+            regenerate_session()
             login_user(user, remember=form.remember_me.data)
             flash(f'Login successful! Your new password for next login is: {new_password}', 'success')
             flash('Please note down this password for your next login!', 'warning')
             
             next_page = request.args.get('next')
-            return redirect(next_page or url_for('index'))
+            return redirect(next_page or url_for('main.index'))
         else:
             flash('Invalid email or password', 'danger')
     
     return render_template('login.html', form=form)
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -116,24 +132,41 @@ def register():
         
         flash(f'Registration successful! Your password is: {password}', 'success')
         flash('Please note down this password for your login!', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('register.html', form=form)
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
+    regenerate_session()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/profile')
+@main.route('/profile')
 @login_required
 def profile():
-    bookings = Booking.query.filter_by(user_id=current_user.id).all()
-    return render_template('profile.html', bookings=bookings)
+    from utils.booking_history import BOOKING_STATUSES, decode_cursor, get_booking_counts, get_booking_page
+    
+    status = request.args.get('status')
+    if status not in BOOKING_STATUSES:
+        status = None
+    
+    # One page of bookings with their hotels and cars, plus one counts query
+    bookings, next_cursor = get_booking_page(current_user.id, status, decode_cursor(request.args.get('before')))
+    counts = get_booking_counts(current_user.id)
+    return render_template(
+        'profile.html',
+        bookings=bookings,
+        counts=counts,
+        status=status,
+        statuses=BOOKING_STATUSES,
+        next_cursor=next_cursor,
+        paged='before' in request.args
+    )
 
-@app.route('/cancel_booking/<int:booking_id>', methods=['POST'])
+@main.route('/cancel_booking/<int:booking_id>', methods=['POST'])
 @login_required
 def cancel_booking(booking_id):
     """Cancel a booking and free up the reserved rooms"""
@@ -142,7 +175,7 @@ def cancel_booking(booking_id):
     # Ensure the booking belongs to the current user
     if booking.user_id != current_user.id:
         flash('You can only cancel your own bookings.', 'danger')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
     
     # Call the cancel method which handles freeing up room availability
     if booking.cancel():
@@ -150,66 +183,114 @@ def cancel_booking(booking_id):
     else:
         flash('There was an error cancelling your booking.', 'danger')
     
-    return redirect(url_for('profile'))
+    return redirect(url_for('main.profile'))
 
-@app.route('/hotel_availability/<int:hotel_id>')
+@main.route('/hotel_availability/<int:hotel_id>')
 @login_required
 def hotel_availability(hotel_id):
     """View room availability for a hotel"""
     from datetime import datetime, timedelta
+    from utils.inventory import availability_grid, ensure_inventory
+    from utils.occupancy import available_tonight
     
     hotel = Hotel.query.get_or_404(hotel_id)
     
-    # Get date range (default to next 7 days)
+    # Get date range (default to the next 8 days)
     start_date_str = request.args.get('start_date')
     try:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else datetime.now().date()
     except ValueError:
         start_date = datetime.now().date()
+    days = min(max(request.args.get('days', 8, type=int), 1), AVAILABILITY_MAX_DAYS)
     
-    end_date = start_date + timedelta(days=7)
-    
-    # Get all room availability records for this date range
-    room_availability = RoomAvailability.query.filter(
-        RoomAvailability.hotel_id == hotel_id,
-        RoomAvailability.date.between(start_date, end_date)
-    ).order_by(RoomAvailability.date, RoomAvailability.room_number).all()
+    # Hotels booked before the bitmaps existed get them built once; after
+    # that this view only reads
+    if hotel.inventory_version is None:
+        ensure_inventory(hotel)
+        db.session.commit()
     
-    # Group by date and room number for easy display
-    availability_by_date = {}
-    for avail in room_availability:
-        date_str = avail.date.strftime('%Y-%m-%d')
-        if date_str not in availability_by_date:
-            availability_by_date[date_str] = {}
-        availability_by_date[date_str][avail.room_number] = avail.is_available
+    # One bitmap per room, read from the hotel's cached inventory
+    bitmaps = availability_grid(hotel, start_date, days)
+    grid = [(room, [bool(bits >> day & 1) for day in range(days)]) for room, bits in enumerate(bitmaps, start=1)]
     
     # Generate dates for display
-    date_range = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_range.append(current_date)
-        current_date += timedelta(days=1)
+    date_range = [start_date + timedelta(days=day) for day in range(days)]
     
     return render_template(
         'hotel_availability.html',
         hotel=hotel,
         date_range=date_range,
-        availability=availability_by_date,
-        total_rooms=hotel.total_rooms
+        grid=grid,
+        total_rooms=hotel.total_rooms,
+        available_rooms=available_tonight(hotel)
     )
 
-@app.route('/hotels', methods=['GET', 'POST'])
+@main.route('/api/hotels/<int:hotel_id>/availability')
 @login_required
-def hotels():
-    form = HotelSearchForm()
-    hotel_recommendations = []
+def hotel_availability_api(hotel_id):
+    """
+    Rooms x days occupancy of a hotel as JSON
     
+    Query parameters: start (YYYY-MM-DD, default today) and days (1 to
+    AVAILABILITY_MAX_DAYS, default 7). Each room is a string with one
+    character per night, "1" for booked and "0" for free. Responses carry an
+    ETag that changes whenever the hotel's inventory does.
+    """
+    from datetime import datetime, timedelta
+    from utils.inventory import availability_grid, ensure_inventory, get_inventory
+    
+    hotel = Hotel.query.get_or_404(hotel_id)
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args else datetime.now().date()
+        days = int(request.args.get('days', 7))
+    except ValueError:
+        return {'error': 'start must be YYYY-MM-DD and days a number'}, 400
+    if not 1 <= days <= AVAILABILITY_MAX_DAYS:
+        return {'error': f'days must be between 1 and {AVAILABILITY_MAX_DAYS}'}, 400
+    
+    ensure_inventory(hotel)
+    db.session.commit()
+    
+    # The inventory version changes on every booking and cancellation
+    etag = f'{hotel.id}-{hotel.inventory_version}-{hotel.total_rooms}-{start.isoformat()}-{days}'
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    bitmaps = availability_grid(hotel, start, days)
+    rooms = [format(bits, f'0{days}b')[::-1] for bits in bitmaps]
+    response = current_app.json.response({
+        'hotel_id': hotel.id,
+        'start': start.isoformat(),
+        'days': days,
+        'total_rooms': hotel.total_rooms,
+        'rooms': rooms,
+        'free_per_day': get_inventory(hotel).free_rooms_per_night(start, start + timedelta(days=days))
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def hotel_search(form):
+    """
+    Read a submitted hotel search form
+    
+    Shared by the WSGI view and the async one in asgi.py.
+    
+    Returns:
+        tuple: (destination, budget), or None when nothing valid was submitted
+    """
     if form.validate_on_submit():
-        destination = form.destination.data
-        budget = form.budget.data
-        
-        # Get hotel recommendations from ChatGPT
-        recommendations = get_hotel_recommendations(destination, budget)
+        return form.destination.data, form.budget.data
+    return None
+
+def render_hotels(form, search=None, recommendations=None):
+    """Render the hotels page, remembering a search's recommendations in the session"""
+    hotel_recommendations = []
+    
+    if search is not None:
+        destination, _ = search
         
         # Process recommendations (normally would come from a real API)
         if recommendations:
@@ -225,12 +306,25 @@ def hotels():
     
     return render_template('hotels.html', form=form, recommendations=hotel_recommendations)
 
-@app.route('/book_hotel/<int:hotel_id>', methods=['POST'])
+@main.route('/hotels', methods=['GET', 'POST'])
 @login_required
-def book_hotel(hotel_id):
-    from datetime import datetime, timedelta
+def hotels():
+    form = HotelSearchForm()
+    search = hotel_search(form)
+    if search is None:
+        return render_hotels(form)
     
-    hotel = Hotel.query.get(hotel_id)
+    # Search our own hotels first, asking ChatGPT only when there are too few
+    return render_hotels(form, search, find_hotels(*search))
+
+def stay_dates():
+    """
+    Read the check-in and check-out dates posted to a booking route
+    
+    Returns:
+        tuple: (check_in_date, check_out_date), or None after flashing why they are invalid
+    """
+    from datetime import datetime
     
     # Extract check-in and check-out dates from form data
     check_in_date_str = request.form.get('check_in_date')
@@ -238,119 +332,66 @@ def book_hotel(hotel_id):
     
     if not check_in_date_str or not check_out_date_str:
         flash('Please provide both check-in and check-out dates.', 'danger')
-        return redirect(url_for('hotels'))
+        return None
     
     try:
         check_in_date = datetime.strptime(check_in_date_str, '%Y-%m-%d').date()
         check_out_date = datetime.strptime(check_out_date_str, '%Y-%m-%d').date()
     except ValueError:
         flash('Invalid date format. Please use YYYY-MM-DD.', 'danger')
-        return redirect(url_for('hotels'))
+        return None
     
     if check_in_date >= check_out_date:
         flash('Check-out date must be after check-in date.', 'danger')
-        return redirect(url_for('hotels'))
-    
-    if not hotel:
-        # If hotel doesn't exist in DB yet, we'd create it from the recommendations
-        if 'hotel_recommendations' in session:
-            for rec in session['hotel_recommendations']:
-                if rec.get('id') == hotel_id:
-                    hotel = Hotel(
-                        id=hotel_id,
-                        name=rec.get('name'),
-                        location=rec.get('location'),
-                        price_per_night=rec.get('price'),
-                        rating=rec.get('rating', 0)
-                    )
-                    db.session.add(hotel)
-                    db.session.commit()
-                    break
+        return None
     
+    return check_in_date, check_out_date
+
+def book_hotel_stay(hotel, check_in_date, check_out_date):
     if hotel:
-        # Check if the hotel has available rooms for the requested dates
-        if not hotel.is_available(check_in_date, check_out_date):
-            flash(f'Sorry, {hotel.name} is fully booked for the selected dates.', 'danger')
-            return redirect(url_for('hotels'))
+        # Lock the hotel, assign a room and write the stay in one transaction,
+        # retrying on another room if a concurrent booking wins the race
+        result = book_stay(hotel, current_user.id, check_in_date, check_out_date)
         
-        # Create the booking
-        booking = Booking(
-            user_id=current_user.id,
-            hotel_id=hotel.id,
-            booking_type='hotel',
-            check_in_date=check_in_date,
-            check_out_date=check_out_date,
-            status='confirmed'
-        )
-        db.session.add(booking)
-        db.session.flush()  # Get booking ID without committing
+        if result.status == 'sold_out':
+            flash(f'Sorry, {hotel.name} is fully booked for the selected dates.', 'danger')
+            return redirect(url_for('main.hotels'))
+        if result.status == 'conflict':
+            flash('The hotel is busy right now. Please try booking again.', 'danger')
+            return redirect(url_for('main.hotels'))
         
-        # Generate availability records for each day of the stay
-        # Assign a room number (simple algorithm - just grab the first available room)
-        current_date = check_in_date
         day_count = (check_out_date - check_in_date).days
-        room_number = None
-        
-        # Find the first available room number
-        for room_num in range(1, hotel.total_rooms + 1):
-            # Check if this room is available for all days of the stay
-            conflicting_dates = RoomAvailability.query.filter(
-                RoomAvailability.hotel_id == hotel.id,
-                RoomAvailability.room_number == room_num,
-                RoomAvailability.date.between(check_in_date, check_out_date - timedelta(days=1)),
-                RoomAvailability.is_available == False
-            ).count()
-            
-            if conflicting_dates == 0:
-                room_number = room_num
-                break
-                
-        if room_number is None:
-            flash('No rooms available for the selected dates.', 'danger')
-            db.session.rollback()
-            return redirect(url_for('hotels'))
-        
-        # Create room availability entries for each day
-        for _ in range(day_count):
-            # Check if we already have an entry for this room/date
-            existing_entry = RoomAvailability.query.filter_by(
-                hotel_id=hotel.id,
-                date=current_date,
-                room_number=room_number
-            ).first()
-            
-            if existing_entry:
-                if not existing_entry.is_available:
-                    flash(f'Room {room_number} is already booked for {current_date}.', 'danger')
-                    db.session.rollback()
-                    return redirect(url_for('hotels'))
-                # Room exists and is available, update it
-                existing_entry.is_available = False
-                existing_entry.booking_id = booking.id
-            else:
-                # Create new availability entry
-                room_avail = RoomAvailability(
-                    hotel_id=hotel.id,
-                    date=current_date,
-                    is_available=False,
-                    booking_id=booking.id,
-                    room_number=room_number
-                )
-                db.session.add(room_avail)
-            
-            current_date += timedelta(days=1)
-        
-        # Update hotel's available rooms count
-        hotel.update_availability()
-        db.session.commit()
-        
-        flash(f'Successfully booked {hotel.name} for {day_count} nights (Room {room_number})!', 'success')
+        flash(f'Successfully booked {hotel.name} for {day_count} nights (Room {result.room_number})!', 'success')
     else:
         flash('Hotel not found or unable to book.', 'danger')
     
-    return redirect(url_for('hotels'))
+    return redirect(url_for('main.hotels'))
+
+@main.route('/book_hotel/<int:hotel_id>', methods=['POST'])
+@login_required
+def book_hotel(hotel_id):
+    stay = stay_dates()
+    if stay is None:
+        return redirect(url_for('main.hotels'))
+    
+    return book_hotel_stay(db.session.get(Hotel, hotel_id), *stay)
 
-@app.route('/car_rentals', methods=['GET', 'POST'])
+@main.route('/book_hotel/recommended/<int:index>', methods=['POST'])
+@login_required
+def book_recommended_hotel(index):
+    """Book a ChatGPT recommendation from the last search, storing the hotel only now"""
+    stay = stay_dates()
+    if stay is None:
+        return redirect(url_for('main.hotels'))
+    
+    # The recommendations were kept server-side by the search, so they can be trusted
+    recommendations = session.get('hotel_recommendations') or []
+    hotel = None
+    if index < len(recommendations) and recommendations[index].get('id') is None:
+        hotel = save_recommendation(recommendations[index])
+    return book_hotel_stay(hotel, *stay)
+
+@main.route('/car_rentals', methods=['GET', 'POST'])
 @login_required
 def car_rentals():
     form = CarRentalForm()
@@ -373,11 +414,11 @@ def car_rentals():
         db.session.commit()
         
         flash('Car rental booked successfully!', 'success')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
     
     return render_template('car_rentals.html', form=form)
 
-@app.route('/destinations')
+@main.route('/destinations')
 def destinations():
     # Sample destinations for the map
     sample_destinations = [
@@ -389,93 +430,333 @@ def destinations():
     ]
     return render_template('destinations.html', destinations=sample_destinations)
 
-@app.route('/api/coordinates', methods=['GET'])
-def coordinates():
+def location_param():
+    """Return (location, error response) for /api/coordinates; one of them is None"""
     location = request.args.get('location', '')
     if not location:
-        return {'error': 'No location provided'}, 400
-    
-    coords = get_coordinates(location)
+        return None, ({'error': 'No location provided'}, 400)
+    return location, None
+
+def coordinates_response(coords):
     if coords:
         return {'lat': coords['lat'], 'lng': coords['lng']}
     else:
         return {'error': 'Location not found'}, 404
 
-@app.route('/assistant')
+def batch_locations():
+    """
+    Read the locations of a /api/coordinates/batch request
+    
+    Returns:
+        tuple: (locations, error response); one of them is None
+    """
+    data = request.get_json(silent=True)
+    locations = data.get('locations') if isinstance(data, dict) else None
+    if not isinstance(locations, list) or not locations:
+        return None, ({'error': 'No locations provided'}, 400)
+    
+    limit = int(os.environ.get('GEOCODE_BATCH_LIMIT', '300'))
+    if len(locations) > limit:
+        return None, ({'error': f'Too many locations (maximum {limit})'}, 400)
+    
+    return [location.strip() for location in locations if isinstance(location, str) and location.strip()], None
+
+@main.route('/api/coordinates', methods=['GET'])
+def coordinates():
+    location, error = location_param()
+    if error:
+        return error
+    
+    return coordinates_response(get_coordinates(location))
+
+@main.route('/api/coordinates/batch', methods=['POST'])
+def coordinates_batch():
+    """
+    Geocode up to GEOCODE_BATCH_LIMIT locations in one request
+    
+    Expects {"locations": [...]} and returns {"results": {location: {lat, lng} or null}}
+    """
+    locations, error = batch_locations()
+    if error:
+        return error
+    
+    return {'results': get_coordinates_batch(locations)}
+
+@main.route('/api/hotels/availability', methods=['GET'])
+def hotels_availability():
+    """
+    Hotels in a destination under a budget with a room free for the whole stay
+    
+    Query parameters: destination, budget, check_in and check_out (YYYY-MM-DD)
+    and an optional limit. Each hotel includes its minimum free-room count.
+    """
+    from datetime import datetime
+    from utils.hotel_search import search_available_hotels
+    
+    destination = request.args.get('destination', '').strip()
+    if not destination:
+        return {'error': 'No destination provided'}, 400
+    
+    try:
+        budget = float(request.args['budget'])
+        check_in = datetime.strptime(request.args['check_in'], '%Y-%m-%d').date()
+        check_out = datetime.strptime(request.args['check_out'], '%Y-%m-%d').date()
+        limit = int(request.args.get('limit', 0)) or None
+    except (KeyError, ValueError):
+        return {'error': 'budget, check_in and check_out (YYYY-MM-DD) are required'}, 400
+    
+    if check_in >= check_out:
+        return {'error': 'check_out must be after check_in'}, 400
+    
+    hotels = search_available_hotels(destination, budget, check_in, check_out, limit)
+    return {'hotels': hotels, 'count': len(hotels)}
+
+@main.route('/api/admin/bookings/cancel', methods=['POST'])
+@admin_required
+def admin_cancel_bookings():
+    """
+    Cancel many bookings in one transaction
+    
+    Expects either {"booking_ids": [...]} or, e.g. for a hotel closure,
+    {"hotel_id": id, "from": "YYYY-MM-DD", "to": "YYYY-MM-DD"} to cancel
+    every stay at the hotel with a night in [from, to). Returns the ids of
+    the bookings that were cancelled.
+    """
+    from datetime import datetime
+    from utils.booking import cancel_bookings
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {'error': 'Expected a JSON object'}, 400
+    
+    if 'booking_ids' in data:
+        booking_ids = data['booking_ids']
+        if not isinstance(booking_ids, list) or not all(isinstance(i, int) for i in booking_ids):
+            return {'error': 'booking_ids must be a list of integers'}, 400
+        if len(booking_ids) > BULK_CANCEL_LIMIT:
+            return {'error': f'Too many bookings (maximum {BULK_CANCEL_LIMIT})'}, 400
+        criteria = [Booking.id.in_(booking_ids)]
+    elif 'hotel_id' in data:
+        try:
+            hotel_id = int(data['hotel_id'])
+            start = datetime.strptime(data['from'], '%Y-%m-%d').date()
+            end = datetime.strptime(data['to'], '%Y-%m-%d').date()
+        except (KeyError, TypeError, ValueError):
+            return {'error': 'hotel_id, from and to (YYYY-MM-DD) are required'}, 400
+        if start >= end:
+            return {'error': 'from must be before to'}, 400
+        criteria = [
+            Booking.hotel_id == hotel_id,
+            Booking.check_in_date < end,
+            Booking.check_out_date > start
+        ]
+    else:
+        return {'error': 'Provide booking_ids or hotel_id with from and to'}, 400
+    
+    try:
+        cancelled = cancel_bookings(*criteria)
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in bulk cancellation: {e}")
+        return {'error': 'Cancellation failed, nothing was cancelled'}, 500
+    
+    logging.info(f"Admin {current_user.email} cancelled {len(cancelled)} bookings")
+    return {'cancelled': cancelled, 'count': len(cancelled)}
+
+@main.route('/assistant')
 def assistant():
     """
     Route for the AI Travel Assistant chatbot interface
     """
     return render_template('assistant.html')
 
-@app.route('/api/chat', methods=['POST'])
+# Returned by /api/chat when handling a message fails
+CHAT_ERROR_RESPONSE = ({
+    'error': 'An unexpected error occurred while processing your request.',
+    'response': 'I apologize, but I encountered an error. Our team has been notified, and we\'re working to resolve it. Please try again later.'
+}, 500)
+
+def chat_message():
+    """Return the message posted to /api/chat, or None when there is none"""
+    data = request.get_json()
+    if not data or 'message' not in data:
+        return None
+    return data['message']
+
+def chat_reply(chat_history, user_message, assistant_response):
+    """Add a turn to the chat history and build the /api/chat response for it"""
+    chat_history.append({"role": "user", "content": user_message})
+    chat_history.append({"role": "assistant", "content": assistant_response})
+    
+    # Check if the response indicates a rate limit error (our fallback mechanism)
+    if "offline mode" in assistant_response:
+        # Still return the response but with a flag indicating rate limiting
+        return {
+            'response': assistant_response,
+            'status': 'limited'
+        }
+    
+    return {'response': assistant_response}
+
+@main.route('/api/chat', methods=['POST'])
 def chat():
     """
     API endpoint to process chat messages and get responses from OpenAI
     """
     from utils.openai_helper import get_chat_response
-    import logging
     
     try:
-        data = request.get_json()
-        
-        if not data or 'message' not in data:
+        user_message = chat_message()
+        if user_message is None:
             return {'error': 'No message provided'}, 400
         
-        user_message = data['message']
-        
-        # Store chat history in session for context
-        if 'chat_history' not in session:
-            session['chat_history'] = []
-        
-        # Add user message to history
-        session['chat_history'].append({"role": "user", "content": user_message})
-        
-        # Get response from OpenAI
-        assistant_response = get_chat_response(user_message, session['chat_history'])
-        
-        # Add assistant response to history
-        session['chat_history'].append({"role": "assistant", "content": assistant_response})
-        
-        # Keep only the last 20 messages to avoid token limits
-        if len(session['chat_history']) > 20:
-            session['chat_history'] = session['chat_history'][-20:]
+        # Chat history is stored server-side; the session only holds its id
+        conversation_id = get_conversation_id()
+        summary, chat_history = load_conversation(conversation_id)
         
-        # Check if the response indicates a rate limit error (our fallback mechanism)
-        if "offline mode" in assistant_response:
-            # Still return the response but with a flag indicating rate limiting
-            return {
-                'response': assistant_response,
-                'status': 'limited'
-            }
+        # Get response from OpenAI; the new message is sent after the history
+        assistant_response = get_chat_response(user_message, chat_history, summary)
         
-        return {'response': assistant_response}
+        # Add both to history (older turns are folded into the summary)
+        reply = chat_reply(chat_history, user_message, assistant_response)
+        save_conversation(conversation_id, chat_history, summary)
+        return reply
         
     except Exception as e:
         logging.error(f"Error in chat endpoint: {e}")
-        return {
-            'error': 'An unexpected error occurred while processing your request.',
-            'response': 'I apologize, but I encountered an error. Our team has been notified, and we\'re working to resolve it. Please try again later.'
-        }, 500
+        return CHAT_ERROR_RESPONSE
+
+@main.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Stream the assistant's reply as Server-Sent Events
+    
+    Each piece of the reply is sent as a `data: {"delta": ...}` event as soon as
+    it arrives, followed by an `event: done` carrying the status. The full reply
+    is saved to the chat history once streaming finishes.
+    """
+    import json
+    from flask import Response, stream_with_context
+    from utils.openai_helper import stream_chat_response
+    
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return {'error': 'No message provided'}, 400
+    
+    user_message = data['message']
+    conversation_id = get_conversation_id()
+    summary, chat_history = load_conversation(conversation_id)
+    
+    def generate():
+        pieces = []
+        try:
+            for piece in stream_chat_response(user_message, chat_history, summary):
+                pieces.append(piece)
+                yield f"data: {json.dumps({'delta': piece})}\n\n"
+        except Exception as e:
+            logging.error(f"Error in chat stream: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'An unexpected error occurred while processing your request.'})}\n\n"
+            return
+        
+        assistant_response = ''.join(pieces)
+        chat_history.append({"role": "user", "content": user_message})
+        chat_history.append({"role": "assistant", "content": assistant_response})
+        save_conversation(conversation_id, chat_history, summary)
+        
+        status = 'limited' if "offline mode" in assistant_response else 'ok'
+        yield f"event: done\ndata: {json.dumps({'status': status})}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@main.route('/api/circuit_breakers')
+@admin_required
+def circuit_breakers():
+    """Report the state and recent transitions of the upstream circuit breakers"""
+    from utils.circuit_breaker import get_breakers
+    return {'breakers': get_breakers()}
+
+@main.route('/metrics')
+def prometheus_metrics():
+    """Request, SQL, upstream and cache metrics of this process for Prometheus"""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())) and not is_admin():
+        return {'error': 'Metrics require a token or admin access'}, 403
+    return current_app.response_class(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
 
 # Error handlers
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('500.html'), 500
 
 # Context processor to provide the current year to all templates
-@app.context_processor
+@main.app_context_processor
 def inject_current_year():
     from datetime import datetime
     return {'current_year': datetime.now().year}
     
 # Add Google Maps API key to all templates
-@app.context_processor
+@main.app_context_processor
 def inject_google_maps_api_key():
     import os
     return {'GOOGLE_MAPS_API_KEY': os.environ.get('GOOGLE_MAPS_API_KEY')}
+
+def create_app(config=None):
+    """
+    Create and configure the Flask app
+    
+    Nothing here touches the database or builds an API client, so importing
+    the app is cheap and safe before gunicorn forks its workers (--preload).
+    The schema is created and upgraded with `flask db upgrade` (or at start
+    with AUTO_MIGRATE=1); OpenAI and HTTP clients are created on first use.
+    
+    Args:
+        config (dict, optional): Settings that override the environment
+    
+    Returns:
+        Flask: The configured app
+    """
+    logging.basicConfig(level=LOG_LEVEL)
+    
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET")
+    
+    # Configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///travel_companion.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)  # Set session to expire after 7 days
+    if config:
+        app.config.update(config)
+    
+    # Initialize the app with the extension
+    db.init_app(app)
+    
+    # Keep session data server-side; the cookie only carries the session id
+    app.session_interface = ServerSideSessionInterface(create_session_backend())
+    
+    login_manager.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app, allow_header=is_admin)
+    app.register_blueprint(main)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(rooms_cli)
+    app.cli.add_command(geocode_cli)
+    app.cli.add_command(profiling.profile_cli)
+    
+    if AUTO_MIGRATE:
+        with app.app_context():
+            upgrade()
+    return app
+
+app = create_app()
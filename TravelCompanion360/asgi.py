@@ -0,0 +1,213 @@
+"""
+ASGI entry point for serving the app with upstream-bound routes running async.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+The routes that spend nearly all their time waiting on OpenAI or Google Maps
+(/api/coordinates, /api/coordinates/batch, /api/chat and /hotels) are handled
+by native async views below, so a single process can keep hundreds of upstream
+calls in flight. Every other route runs the normal Flask app on a thread pool.
+Blocking database calls in the async views run on threads via _run_db().
+"""
+import io
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask_login import current_user
+
+from app import (
+    CHAT_ERROR_RESPONSE, app as flask_app, batch_locations, chat_message, chat_reply,
+    coordinates_response, hotel_search, location_param, render_hotels
+)
+from db import db
+
+# Threads for the sync Flask routes and for blocking calls made by async views
+ASGI_SYNC_THREADS = int(os.environ.get("ASGI_SYNC_THREADS", "32"))
+
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps on a single shared thread by default, which would
+    # serialize every sync route; run them on the executor's threads instead
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+
+class _ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_application = _ThreadedWsgiToAsgi(flask_app.wsgi_app)
+
+
+async def _run_db(fn, *args):
+    """
+    Run a blocking database call on a thread and release its connection
+
+    The request's session would otherwise keep the connection checked out
+    while the view awaits an upstream, and a few hundred waiting requests
+    would drain the pool.
+    """
+    def call():
+        try:
+            return fn(*args)
+        finally:
+            db.session.close()
+    return await asyncio.to_thread(call)
+
+
+def _is_authenticated():
+    return current_user.is_authenticated
+
+
+async def coordinates():
+    from utils.maps_helper import async_get_coordinates
+
+    location, error = location_param()
+    if error:
+        return error
+
+    return coordinates_response(await async_get_coordinates(location))
+
+
+async def coordinates_batch():
+    from utils.maps_helper import async_get_coordinates_batch
+
+    locations, error = batch_locations()
+    if error:
+        return error
+
+    return {'results': await async_get_coordinates_batch(locations)}
+
+
+async def chat():
+    from utils.openai_helper import async_get_chat_response, async_summarize_conversation
+    from utils.chat_context import compact_history
+    from utils.chat_history import get_conversation_id, load_conversation, save_conversation
+
+    try:
+        user_message = chat_message()
+        if user_message is None:
+            return {'error': 'No message provided'}, 400
+
+        # Loads the server-side session off the event loop too
+        conversation_id = await _run_db(get_conversation_id)
+        summary, chat_history = await _run_db(load_conversation, conversation_id)
+
+        assistant_response = await async_get_chat_response(user_message, chat_history, summary)
+        reply = chat_reply(chat_history, user_message, assistant_response)
+
+        # Summarize here so save_conversation() has nothing left to fold on its thread
+        older, chat_history = compact_history(chat_history)
+        if older:
+            summary = await async_summarize_conversation(summary, older)
+        await _run_db(save_conversation, conversation_id, chat_history, summary)
+        return reply
+
+    except Exception as e:
+        logging.error(f"Error in chat endpoint: {e}")
+        return CHAT_ERROR_RESPONSE
+
+
+async def hotels():
+    from forms import HotelSearchForm
+    from utils.hotel_search import async_find_hotels
+
+    # Same as @login_required, with the user loaded off the event loop
+    if not await _run_db(_is_authenticated):
+        return flask_app.login_manager.unauthorized()
+
+    form = HotelSearchForm()
+    search = hotel_search(form)
+    if search is None:
+        return render_hotels(form)
+
+    return render_hotels(form, search, await async_find_hotels(*search))
+
+
+# (method, path) -> async view; everything else goes to the WSGI app
+ASYNC_ROUTES = {
+    ('GET', '/api/coordinates'): coordinates,
+    ('POST', '/api/coordinates/batch'): coordinates_batch,
+    ('POST', '/api/chat'): chat,
+    ('GET', '/hotels'): hotels,
+    ('POST', '/hotels'): hotels,
+}
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def _build_environ(scope, body):
+    instance = _ThreadedWsgiInstance(flask_app.wsgi_app)
+    instance.scope = scope
+    return instance.build_environ(scope, io.BytesIO(body))
+
+
+async def _dispatch(view, environ):
+    """
+    Run an async view inside a Flask request context, like Flask.full_dispatch_request()
+
+    Popping the context runs the teardown handlers, which remove the scoped
+    database session, whether or not the view succeeded.
+    """
+    ctx = flask_app.request_context(environ)
+    ctx.push()
+    error = None
+    try:
+        try:
+            rv = flask_app.preprocess_request()
+            if rv is None:
+                rv = await view()
+        except Exception as e:
+            rv = flask_app.handle_user_exception(e)
+        response = flask_app.make_response(rv)
+        # after_request hooks and saving the session may touch the database
+        return await _run_db(flask_app.process_response, response)
+    except Exception as e:
+        error = e
+        return flask_app.make_response(flask_app.handle_exception(e))
+    finally:
+        ctx.pop(error)
+
+
+async def _lifespan(receive, send):
+    from utils.http_client import get_async_client
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=ASGI_SYNC_THREADS))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await get_async_client().aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    view = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if view is None:
+        return await wsgi_application(scope, receive, send)
+
+    environ = _build_environ(scope, await _read_body(receive))
+    response = await _dispatch(view, environ)
+
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.to_wsgi_list()]
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
@@ -0,0 +1,185 @@
+"""
+Compare how many concurrent upstream-bound requests sync and async serving can handle.
+
+Usage:
+    python benchmarks/async_capacity.py --requests 400 --workers 8 --latency 0.5
+
+A local asyncio stub server stands in for the Google Geocoding API and the
+OpenAI chat API, answering every call after --latency seconds and counting how
+many calls it holds at once. Sync mode pushes the
+requests through the WSGI app on --workers threads, like that many sync
+gunicorn workers; async mode sends them all at once to the ASGI app in
+asgi.py. Every request uses a new location or message, so no cache can answer
+it. A throwaway SQLite database is used unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+GEOCODE_REPLY = {'status': 'OK', 'results': [{'geometry': {'location': {'lat': 48.8566, 'lng': 2.3522}}}]}
+
+
+def chat_reply():
+    return {
+        'id': 'chatcmpl-stub',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': 'gpt-4o',
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': 'Paris is lovely in the spring.'},
+            'finish_reason': 'stop'
+        }]
+    }
+
+
+class StubStats:
+    """Upstream calls the stub is holding right now, and the most it has held at once"""
+    in_flight = 0
+    peak = 0
+
+    @classmethod
+    def reset(cls):
+        cls.in_flight = cls.peak = 0
+
+
+async def stub_upstream(reader, writer, latency):
+    """
+    Slow stand-in for the Geocoding and OpenAI chat completion endpoints
+
+    Each connection is a coroutine on one event loop, so the stub can hold any
+    number of calls at once and never caps the concurrency being measured.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            if length:
+                await reader.readexactly(length)
+
+            StubStats.in_flight += 1
+            StubStats.peak = max(StubStats.peak, StubStats.in_flight)
+            try:
+                await asyncio.sleep(latency)
+            finally:
+                StubStats.in_flight -= 1
+            payload = GEOCODE_REPLY if request_line.startswith(b'GET ') else chat_reply()
+            body = json.dumps(payload).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def start_stub(latency):
+    """Serve the stub on its own event loop thread and return its URL"""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(
+        lambda reader, writer: stub_upstream(reader, writer, latency), '127.0.0.1', 0, backlog=4096))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}'
+
+
+def make_request(endpoint, i, mode):
+    """Return (method, path, json body) for the i-th request of a run"""
+    if endpoint == 'coordinates':
+        return 'GET', f'/api/coordinates?location={mode}+benchmark+city+{i}', None
+    return 'POST', '/api/chat', {'message': f'{mode} benchmark question {i}'}
+
+
+def run_sync(app, endpoint, requests, workers):
+    def call(i):
+        method, path, body = make_request(endpoint, i, 'sync')
+        with app.test_client() as client:
+            return client.open(path, method=method, json=body).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(call, range(requests)))
+    return statuses, time.perf_counter() - started
+
+
+def run_async(application, endpoint, requests):
+    import httpx
+
+    async def main():
+        from asgi import ASGI_SYNC_THREADS
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=ASGI_SYNC_THREADS))
+        transport = httpx.ASGITransport(app=application)
+
+        async def call(i):
+            method, path, body = make_request(endpoint, i, 'async')
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                response = await client.request(method, path, json=body)
+                return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(call(i) for i in range(requests)))
+        return statuses, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def report(mode, statuses, elapsed):
+    ok = sum(1 for status in statuses if status == 200)
+    print(f"{mode:>5}: {ok}/{len(statuses)} ok in {elapsed:.2f}s, "
+          f"{len(statuses) / elapsed:.1f} req/s, at most {StubStats.peak} upstream calls in flight")
+    StubStats.reset()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400, help='concurrent requests per run')
+    parser.add_argument('--workers', type=int, default=8, help='sync workers (threads)')
+    parser.add_argument('--latency', type=float, default=0.5, help='stub upstream latency in seconds')
+    parser.add_argument('--endpoint', choices=['coordinates', 'chat'], default='coordinates')
+    args = parser.parse_args()
+
+    stub_url = start_stub(args.latency)
+    os.environ['GOOGLE_MAPS_API_URL'] = stub_url
+    os.environ['GOOGLE_MAPS_API_KEY'] = 'stub'
+    os.environ['OPENAI_BASE_URL'] = f'{stub_url}/v1'
+    os.environ['OPENAI_API_KEY'] = 'stub'
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    # The async pool must be able to hold every request at once
+    os.environ.setdefault('ASYNC_HTTP_POOL_SIZE', str(args.requests))
+    if 'DATABASE_URL' not in os.environ:
+        db_path = os.path.join(tempfile.mkdtemp(), 'capacity.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    import logging
+    from app import app
+    from asgi import application
+    from utils.migrations import upgrade
+    logging.getLogger().setLevel(logging.WARNING)
+    with app.app_context():
+        upgrade()
+
+    print(f"{args.requests} {args.endpoint} requests, upstream latency {args.latency}s, {args.workers} sync workers")
+    report('sync', *run_sync(app, args.endpoint, args.requests, args.workers))
+    report('async', *run_async(application, args.endpoint, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Fire N parallel bookings at one hotel and report throughput and conflict rate.
+
+Usage:
+    python benchmarks/booking_contention.py --bookings 200 --workers 16 --rooms 50
+
+Each worker thread uses its own database connection, like separate gunicorn
+workers would. A throwaway SQLite database is used unless DATABASE_URL is set.
+Run once with BOOKING_LOCK_MODE=lock and once with BOOKING_LOCK_MODE=none to
+compare locking against constraint-and-retry alone.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=200, help='number of booking requests')
+    parser.add_argument('--workers', type=int, default=16, help='concurrent workers')
+    parser.add_argument('--rooms', type=int, default=50, help='rooms in the hotel')
+    parser.add_argument('--nights', type=int, default=3, help='nights per stay')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        db_path = os.path.join(tempfile.mkdtemp(), 'contention.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    import logging
+    from app import app
+    from db import db
+    from models import Hotel, User
+    from utils.booking import BOOKING_LOCK_MODE, book_stay, get_booking_stats
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        db.create_all()
+        user = User(username=f'bench-{time.time_ns()}', email=f'bench-{time.time_ns()}@example.com', password_hash='-')
+        hotel = Hotel(name='Contention Hotel', location='Benchmark', price_per_night=100,
+                      total_rooms=args.rooms, available_rooms=args.rooms)
+        db.session.add_all([user, hotel])
+        db.session.commit()
+        user_id, hotel_id = user.id, hotel.id
+
+    check_in = date.today() + timedelta(days=30)
+    check_out = check_in + timedelta(days=args.nights)
+
+    def book(_):
+        with app.app_context():
+            hotel = db.session.get(Hotel, hotel_id)
+            return book_stay(hotel, user_id, check_in, check_out).status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        statuses = list(pool.map(book, range(args.bookings)))
+    elapsed = time.perf_counter() - started
+
+    stats = get_booking_stats()
+    attempts = stats.get('attempts', 0)
+    conflicts = stats.get('conflicts', 0)
+    confirmed = statuses.count('confirmed')
+
+    print(f"lock mode:      {BOOKING_LOCK_MODE}")
+    print(f"requests:       {args.bookings} over {args.workers} workers ({args.rooms} rooms)")
+    print(f"confirmed:      {confirmed}")
+    print(f"sold out:       {statuses.count('sold_out')}")
+    print(f"gave up:        {statuses.count('conflict')}")
+    print(f"elapsed:        {elapsed:.3f}s")
+    print(f"throughput:     {args.bookings / elapsed:.1f} requests/s, {confirmed / elapsed:.1f} bookings/s")
+    print(f"conflict rate:  {conflicts / attempts:.1%} of {attempts} attempts" if attempts else "conflict rate:  n/a")
+
+    with app.app_context():
+        from models import RoomAvailability
+        from sqlalchemy import func
+        overbooked = db.session.query(RoomAvailability.date).filter(
+            RoomAvailability.hotel_id == hotel_id,
+            RoomAvailability.is_available == False
+        ).group_by(RoomAvailability.date).having(func.count(RoomAvailability.id) > args.rooms).count()
+        print(f"overbooked nights: {overbooked}")
+
+
+if __name__ == '__main__':
+    main()
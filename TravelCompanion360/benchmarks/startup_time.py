@@ -0,0 +1,95 @@
+"""
+Measure how long a fresh worker takes to import the app and serve its first request.
+
+Usage:
+    python benchmarks/startup_time.py --runs 5 --path / --path /login
+
+Each run is a new Python process, like a newly booted gunicorn worker: it
+times `import app` (which builds the app with create_app()), then the first
+and second request to each --path through the test client. The schema is
+created once beforehand with the migrations, as `flask db upgrade` would at
+deploy time. A throwaway SQLite database is used unless DATABASE_URL is set.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(paths):
+    """Runs in the measured process: print the timings as JSON"""
+    sys.path.insert(0, ROOT)
+    timings = {}
+
+    started = time.perf_counter()
+    from app import app
+    timings['import'] = time.perf_counter() - started
+    timings['modules'] = len(sys.modules)
+
+    client = app.test_client()
+    for path in paths:
+        for label in ('first', 'second'):
+            started = time.perf_counter()
+            status = client.get(path).status_code
+            timings[f'{label} {path}'] = time.perf_counter() - started
+            timings[f'status {path}'] = status
+
+    print(json.dumps(timings))
+
+
+def migrate():
+    sys.path.insert(0, ROOT)
+    from app import app
+    from utils.migrations import upgrade
+    with app.app_context():
+        upgrade()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to measure')
+    parser.add_argument('--path', action='append', help='path to request (repeatable, default /)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--migrate', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    paths = args.path or ['/']
+
+    if args.child:
+        return child(paths)
+    if args.migrate:
+        return migrate()
+
+    env = dict(os.environ)
+    env.setdefault('SESSION_SECRET', 'benchmark')
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    if 'DATABASE_URL' not in env:
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    # Measure the app as a worker would boot it, with the schema already in place
+    env['AUTO_MIGRATE'] = '0'
+    subprocess.run([sys.executable, __file__, '--migrate'], env=env, check=True)
+
+    command = [sys.executable, __file__, '--child'] + [arg for path in paths for arg in ('--path', path)]
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process'] = time.perf_counter() - started
+        runs.append(result)
+
+    print(f"{args.runs} fresh processes, {runs[0]['modules']} modules loaded after import")
+    keys = ['import'] + [f'{label} {path}' for path in paths for label in ('first', 'second')] + ['process']
+    for key in keys:
+        values = [run[key] * 1000 for run in runs]
+        status = f" (HTTP {runs[0]['status ' + key.split(' ', 1)[1]]})" if key.startswith('first ') else ''
+        print(f"{key:>24}: median {statistics.median(values):7.1f} ms, min {min(values):7.1f} ms{status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,23 @@
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+def dialect_insert(model):
+    """
+    Return an INSERT for the model that supports ON CONFLICT clauses
+
+    Args:
+        model: The mapped class to insert into
+
+    Returns:
+        Insert: A SQLite or PostgreSQL insert construct, or None if the
+        current database does not support upserts
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
@@ -1,4 +1,7 @@
 from app import app
 
 if __name__ == "__main__":
+    from utils.migrations import upgrade
+    with app.app_context():
+        upgrade()
     app.run(host="0.0.0.0", port=5000, debug=True)
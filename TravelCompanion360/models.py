@@ -1,5 +1,7 @@
-from datetime import datetime
+import logging
+from datetime import date, datetime, timedelta
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from db import db  # Import db from the new db.py file
 
 class User(db.Model, UserMixin):
@@ -27,65 +29,107 @@ class RoomAvailability(db.Model):
     # Add a unique constraint to ensure we don't double-book
     __table_args__ = (
         db.UniqueConstraint('hotel_id', 'date', 'room_number', name='unique_room_date'),
+        # Stay windows and booked-night counts per hotel, and the nights of one booking on cancel
+        db.Index('ix_room_availability_hotel_date_available', 'hotel_id', 'date', 'is_available'),
+        db.Index('ix_room_availability_booking', 'booking_id'),
     )
     
     def __repr__(self):
         status = "Available" if self.is_available else "Booked"
         return f'<Room {self.room_number} at Hotel {self.hotel_id} on {self.date}: {status}>'
 
+class RoomNightArchive(db.Model):
+    """Past booked room-nights, one row per run of consecutive nights in the same room"""
+    __tablename__ = 'room_night_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    hotel_id = db.Column(db.Integer, db.ForeignKey('hotel.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=True)
+    room_number = db.Column(db.Integer, nullable=True)
+    first_night = db.Column(db.Date, nullable=False)
+    nights = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_room_night_archive_hotel_night', 'hotel_id', 'first_night'),
+        db.Index('ix_room_night_archive_booking', 'booking_id'),
+    )
+    
+    def __repr__(self):
+        return f'<RoomNightArchive room {self.room_number} at Hotel {self.hotel_id} from {self.first_night} ({self.nights} nights)>'
+
+class RoomInventory(db.Model):
+    """Compact occupancy bitmap for one hotel room (bit i = night start_date + i days)"""
+    id = db.Column(db.Integer, primary_key=True)
+    hotel_id = db.Column(db.Integer, db.ForeignKey('hotel.id'), nullable=False)
+    room_number = db.Column(db.Integer, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    occupancy = db.Column(db.LargeBinary, nullable=False, default=b'')
+    
+    __table_args__ = (
+        db.UniqueConstraint('hotel_id', 'room_number', name='unique_hotel_room_inventory'),
+    )
+    
+    def __repr__(self):
+        return f'<RoomInventory room {self.room_number} at Hotel {self.hotel_id} from {self.start_date}>'
+
+class HotelOccupancy(db.Model):
+    """Number of booked rooms per hotel per night, maintained alongside RoomAvailability"""
+    __tablename__ = 'hotel_occupancy'
+    hotel_id = db.Column(db.Integer, db.ForeignKey('hotel.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    booked_rooms = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<HotelOccupancy Hotel {self.hotel_id} on {self.date}: {self.booked_rooms} booked>'
+
 class Hotel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     location = db.Column(db.String(100), nullable=False)
-    price_per_night = db.Column(db.Float, nullable=False)
-    rating = db.Column(db.Float, default=0)
+    price_per_night = db.Column(db.Float, nullable=False, index=True)
+    rating = db.Column(db.Float, default=0, index=True)
     description = db.Column(db.Text)
     total_rooms = db.Column(db.Integer, default=20)
     available_rooms = db.Column(db.Integer, default=20)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+    availability_date = db.Column(db.Date, nullable=True)  # The night available_rooms describes
+    inventory_version = db.Column(db.Integer, nullable=True)  # None until the room inventory is built
+    location_key = db.Column(db.String(255), index=True)  # normalize_location(location), kept by the search index
     
     # Relationships
     bookings = db.relationship('Booking', backref='hotel', lazy=True)
     room_availability = db.relationship('RoomAvailability', backref='hotel', lazy=True, cascade='all, delete-orphan')
+    room_inventory = db.relationship('RoomInventory', backref='hotel', lazy=True, cascade='all, delete-orphan')
+    occupancy = db.relationship('HotelOccupancy', backref='hotel', lazy=True, cascade='all, delete-orphan')
+    
+    @validates('location')
+    def _set_location_key(self, key, location):
+        from utils.cache import normalize_location
+        self.location_key = normalize_location(location) if location else None
+        return location
     
     def __repr__(self):
         return f'<Hotel {self.name}>'
         
     def update_availability(self):
-        """Update the number of available rooms based on current bookings"""
-        active_bookings = RoomAvailability.query.filter_by(hotel_id=self.id, is_available=False).count()
-        self.available_rooms = max(0, self.total_rooms - active_bookings)
+        """Recompute tonight's available rooms from the nightly occupancy counter"""
+        from utils.occupancy import max_booked_rooms
+        
+        today = date.today()
+        self.available_rooms = max(0, (self.total_rooms or 0) - max_booked_rooms(self.id, today, today + timedelta(days=1)))
+        self.availability_date = today
         self.last_updated = datetime.utcnow()
         return self.available_rooms
         
     def is_available(self, check_in_date, check_out_date):
         """Check if the hotel has available rooms for the given dates"""
-        from sqlalchemy import and_, func
+        from utils.inventory import ensure_inventory
+        from utils.occupancy import max_booked_rooms
         
-        # Calculate how many rooms are booked during the requested period
-        booked_rooms = db.session.query(func.count(RoomAvailability.id)).filter(
-            and_(
-                RoomAvailability.hotel_id == self.id,
-                RoomAvailability.is_available == False,
-                RoomAvailability.date >= check_in_date,
-                RoomAvailability.date < check_out_date
-            )
-        ).scalar()
+        ensure_inventory(self)
         
-        # If any day has all rooms booked, the hotel is not available
-        max_booked = db.session.query(func.count(RoomAvailability.id)).\
-            filter(RoomAvailability.hotel_id == self.id).\
-            filter(RoomAvailability.is_available == False).\
-            filter(RoomAvailability.date.between(check_in_date, check_out_date)).\
-            group_by(RoomAvailability.date).\
-            order_by(func.count(RoomAvailability.id).desc()).\
-            first()
-            
-        max_booked_count = max_booked[0] if max_booked else 0
-        
-        # If the maximum number of rooms booked on any day in the range
-        # is less than the total rooms, then the hotel is available
-        return max_booked_count < self.total_rooms
+        # The hotel is available if no night of the stay has every room booked
+        return max_booked_rooms(self.id, check_in_date, check_out_date) < self.total_rooms
 
 class CarRental(db.Model):
     __tablename__ = 'car_rental'
@@ -102,6 +146,8 @@ class CarRental(db.Model):
         return f'<CarRental {self.car_type} at {self.location}>'
 
 class Booking(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     hotel_id = db.Column(db.Integer, db.ForeignKey('hotel.id'), nullable=True)
     car_rental_id = db.Column(db.Integer, db.ForeignKey('car_rental.id'), nullable=True)
     booking_type = db.Column(db.String(20), nullable=False)  # 'hotel' or 'car'
@@ -113,26 +159,64 @@ class Booking(db.Model):
     # Relationships
     availability = db.relationship('RoomAvailability', backref='booking', lazy=True)
     
+    # Serves the newest-first, keyset-paginated history on /profile
+    __table_args__ = (
+        db.Index('ix_booking_user_date', 'user_id', 'booking_date', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Booking {self.id}, Type: {self.booking_type}>'
         
     def cancel(self):
         """Cancel a booking and free up room availability"""
-        self.status = 'cancelled'
-        # Update room availability
-        if self.booking_type == 'hotel' and self.check_in_date and self.check_out_date:
-            room_dates = RoomAvailability.query.filter_by(
-                booking_id=self.id,
-                hotel_id=self.hotel_id
-            ).all()
-            
-            for room_date in room_dates:
-                room_date.is_available = True
-                room_date.booking_id = None
-            
-            # Update hotel availability count
-            if self.hotel:
-                self.hotel.update_availability()
+        from utils.booking import cancel_bookings
         
-        db.session.commit()
-        return True
\ No newline at end of file
+        try:
+            cancel_bookings(Booking.id == self.id)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error cancelling booking {self.id}: {e}")
+            return False
+        return True
+
+class GeocodeCache(db.Model):
+    """Persisted geocoding results keyed by normalized location (lat/lng are NULL for 'not found')"""
+    __tablename__ = 'geocode_cache'
+    location_key = db.Column(db.String(255), primary_key=True)
+    lat = db.Column(db.Float, nullable=True)
+    lng = db.Column(db.Float, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<GeocodeCache {self.location_key}>'
+
+class UpstreamLock(db.Model):
+    """Cross-worker lock so only one worker makes a given upstream call at a time"""
+    __tablename__ = 'upstream_lock'
+    lock_key = db.Column(db.String(255), primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<UpstreamLock {self.lock_key}>'
+
+class ChatConversation(db.Model):
+    """Travel assistant history kept server-side; the session cookie only holds the conversation id"""
+    __tablename__ = 'chat_conversation'
+    id = db.Column(db.String(32), primary_key=True)
+    messages = db.Column(db.Text, nullable=False, default='[]')  # JSON list of {"role", "content"}
+    summary = db.Column(db.Text)  # Rolling summary of messages no longer kept verbatim
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChatConversation {self.id}>'
+
+class ServerSession(db.Model):
+    """Flask session data kept server-side; the cookie only holds the session id"""
+    __tablename__ = 'server_session'
+    sid = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # Flask's tagged JSON
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ServerSession {self.sid}>'
\ No newline at end of file
@@ -31,25 +31,8 @@ function initMap() {
             try {
                 const destinations = JSON.parse(destinationsData);
                 if (destinations && destinations.length > 0) {
-                    // Add markers for each destination
-                    destinations.forEach(destination => {
-                        addMarker(destination);
-                    });
-                    
-                    // If we have destinations, center on the first one
-                    if (destinations.length > 0) {
-                        map.setCenter({ lat: destinations[0].lat, lng: destinations[0].lng });
-                        map.setZoom(5);
-                    }
-                    
-                    // Create bounds to fit all markers
-                    if (destinations.length > 1) {
-                        const bounds = new google.maps.LatLngBounds();
-                        markers.forEach(marker => {
-                            bounds.extend(marker.getPosition());
-                        });
-                        map.fitBounds(bounds);
-                    }
+                    // Geocode any destinations without coordinates in a single request
+                    resolveDestinationCoordinates(destinations, showDestinations);
                 }
             } catch (error) {
                 console.error("Error parsing destinations data:", error);
@@ -284,6 +267,72 @@ function findNearbyPlaces(location, type) {
     });
 }
 
+// Add markers for destinations and fit the map around them
+function showDestinations(destinations) {
+    // Add markers for each destination
+    destinations.forEach(destination => {
+        addMarker(destination);
+    });
+    
+    // If we have destinations, center on the first one
+    if (destinations.length > 0) {
+        map.setCenter({ lat: destinations[0].lat, lng: destinations[0].lng });
+        map.setZoom(5);
+    }
+    
+    // Create bounds to fit all markers
+    if (destinations.length > 1) {
+        const bounds = new google.maps.LatLngBounds();
+        markers.forEach(marker => {
+            bounds.extend(marker.getPosition());
+        });
+        map.fitBounds(bounds);
+    }
+}
+
+// Fill in lat/lng for destinations that only have a name, then call back with the located ones
+function resolveDestinationCoordinates(destinations, callback) {
+    const missing = destinations.filter(destination => destination.lat == null || destination.lng == null);
+    if (missing.length === 0) {
+        callback(destinations);
+        return;
+    }
+    
+    const label = destination => destination.country ? `${destination.name}, ${destination.country}` : destination.name;
+    getCoordinatesBatch(missing.map(label), function(results) {
+        missing.forEach(destination => {
+            const coords = results[label(destination)];
+            if (coords) {
+                destination.lat = coords.lat;
+                destination.lng = coords.lng;
+            }
+        });
+        callback(destinations.filter(destination => destination.lat != null && destination.lng != null));
+    });
+}
+
+// Get coordinates for many locations in one request using the backend batch API
+function getCoordinatesBatch(locations, callback) {
+    fetch('/api/coordinates/batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ locations: locations })
+    })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Batch geocoding failed');
+            }
+            return response.json();
+        })
+        .then(data => {
+            callback(data.results || {});
+        })
+        .catch(error => {
+            console.error('Error getting coordinates:', error);
+            callback({});
+        });
+}
+
 // Get coordinates for a location using the backend API
 function getCoordinates(location, callback) {
     fetch(`/api/coordinates?location=${encodeURIComponent(location)}`)
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its settings when it is imported, so set them first
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ.setdefault("SESSION_SECRET", "test")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("ADMIN_EMAILS", "admin@example.com")
+os.environ["AUTO_MIGRATE"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    from utils.migrations import upgrade
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        upgrade()
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    """An app context on the migrated test database, emptied after the test"""
+    from db import db
+
+    with app.app_context():
+        yield app
+        db.session.remove()
+        with db.engine.begin() as conn:
+            for table in reversed(db.metadata.sorted_tables):
+                conn.execute(table.delete())
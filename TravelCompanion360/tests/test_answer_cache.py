@@ -0,0 +1,49 @@
+import time
+
+from utils.answer_cache import SemanticCache, is_cacheable, tokenize
+
+
+def filled_cache(**kwargs):
+    cache = SemanticCache(**kwargs)
+    cache.set("What is the best time to visit Tokyo?", "Spring or autumn.")
+    cache.set("Cheap hotels in Paris", "Try the 11th arrondissement.")
+    cache.set("What is the best time to visit Lisbon?", "Late spring.")
+    return cache
+
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert tokenize("What's the best time to visit Tokyo's parks?") == ['what', 'best', 'time', 'visit', 'tokyo', 'park']
+
+
+def test_rephrased_question_reuses_the_answer():
+    cache = filled_cache()
+    assert cache.get("best time to visit tokyo") == "Spring or autumn."
+    assert cache.get("cheap hotel in Paris please") == "Try the 11th arrondissement."
+
+
+def test_question_about_another_place_misses():
+    cache = filled_cache()
+    assert cache.get("What is the best time to visit Kyoto?") is None
+    assert cache.get("what to eat in Tokyo") is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (0, 2)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = filled_cache(maxsize=2)
+    # The Tokyo question was the oldest and is gone; the others remain
+    assert cache.stats()['size'] == 2
+    assert cache.get("best time to visit tokyo") is None
+    assert cache.get("best time to visit Lisbon") == "Late spring."
+
+
+def test_expired_answers_are_not_served():
+    cache = filled_cache(ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("best time to visit tokyo") is None
+
+
+def test_only_first_turn_questions_are_cacheable():
+    assert is_cacheable([], None)
+    assert not is_cacheable([{"role": "user", "content": "hi"}], None)
+    assert not is_cacheable([], "Earlier we talked about Rome.")
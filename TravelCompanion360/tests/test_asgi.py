@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('asgiref')
+
+from db import db
+
+
+def asgi_request(method, path, **kwargs):
+    from asgi import application
+
+    async def send():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+
+@pytest.mark.parametrize('method, path, kwargs', [
+    ('GET', '/api/coordinates', {}),
+    ('POST', '/api/coordinates/batch', {'json': {}}),
+    ('POST', '/api/coordinates/batch', {'json': {'locations': ['x'] * 10000}}),
+    ('POST', '/api/chat', {'json': {}}),
+])
+def test_async_views_answer_like_the_wsgi_views(app, method, path, kwargs):
+    expected = app.test_client().open(path, method=method, **kwargs)
+    response = asgi_request(method, path, **kwargs)
+    assert (response.status_code, response.json()) == (expected.status_code, expected.get_json())
+
+
+def test_async_hotels_redirects_anonymous_users_to_login(app):
+    expected = app.test_client().get('/hotels')
+    response = asgi_request('GET', '/hotels')
+    assert response.status_code == expected.status_code == 302
+    assert response.headers['location'] == expected.headers['location']
+
+
+def test_async_requests_remove_the_database_session(app, monkeypatch):
+    removed = []
+    remove = db.session.remove
+    monkeypatch.setattr(db.session, 'remove', lambda: removed.append(True) or remove())
+
+    asgi_request('GET', '/api/coordinates')
+    assert removed
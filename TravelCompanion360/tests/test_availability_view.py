@@ -0,0 +1,29 @@
+from datetime import date, timedelta
+
+from db import db
+from models import Hotel, User
+from utils.booking import book_stay
+
+
+def test_availability_page_does_not_write_tonights_figure(app_context):
+    user = User(username='guest', email='guest@example.com', password_hash='x')
+    hotel = Hotel(name='View Hotel', location='Vienna', price_per_night=70, total_rooms=4)
+    db.session.add_all([user, hotel])
+    db.session.commit()
+    book_stay(hotel, user.id, date.today(), date.today() + timedelta(days=2))
+    # As if the figure was last refreshed yesterday
+    hotel.available_rooms = 4
+    hotel.availability_date = date.today() - timedelta(days=1)
+    db.session.commit()
+    hotel_id = hotel.id
+
+    client = app_context.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    response = client.get(f'/hotel_availability/{hotel_id}')
+
+    assert response.status_code == 200
+    assert 'Available Now: 3' in response.get_data(as_text=True)
+    db.session.expire_all()
+    hotel = db.session.get(Hotel, hotel_id)
+    assert (hotel.available_rooms, hotel.availability_date) == (4, date.today() - timedelta(days=1))
@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+
+import pytest
+
+from db import db
+from models import Booking, Hotel, HotelOccupancy, RoomAvailability, User
+from utils.booking import book_stay
+
+
+@pytest.fixture
+def client(app_context):
+    admin = User(username='admin', email='admin@example.com', password_hash='x')
+    db.session.add(admin)
+    db.session.commit()
+    client = app_context.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
+
+
+def booked_rooms(hotel_id, night):
+    counter = db.session.get(HotelOccupancy, (hotel_id, night))
+    return counter.booked_rooms if counter else 0
+
+
+def test_bulk_cancel_by_date_range_skips_completed_bookings(client):
+    start = date.today() + timedelta(days=10)
+    user_id = User.query.one().id
+    hotel = Hotel(name='Test Hotel', location='Paris', price_per_night=100, total_rooms=5)
+    db.session.add(hotel)
+    db.session.commit()
+    hotel_id = hotel.id
+
+    completed = book_stay(hotel, user_id, start, start + timedelta(days=2)).booking
+    confirmed = book_stay(db.session.get(Hotel, hotel_id), user_id, start + timedelta(days=1), start + timedelta(days=3)).booking
+    completed_id, confirmed_id = completed.id, confirmed.id
+    completed.status = 'completed'
+    db.session.commit()
+    assert booked_rooms(hotel_id, start + timedelta(days=1)) == 2
+
+    response = client.post('/api/admin/bookings/cancel', json={
+        'hotel_id': hotel_id,
+        'from': start.isoformat(),
+        'to': (start + timedelta(days=5)).isoformat()
+    })
+
+    assert response.status_code == 200
+    assert response.get_json()['cancelled'] == [confirmed_id]
+    db.session.expire_all()
+    assert db.session.get(Booking, completed_id).status == 'completed'
+    assert db.session.get(Booking, confirmed_id).status == 'cancelled'
+    # The completed stay's nights are still counted and still held
+    assert booked_rooms(hotel_id, start) == 1
+    assert booked_rooms(hotel_id, start + timedelta(days=1)) == 1
+    assert booked_rooms(hotel_id, start + timedelta(days=2)) == 0
+    assert RoomAvailability.query.filter_by(booking_id=completed_id).count() == 2
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from utils import circuit_breaker
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def breaker():
+    breaker = CircuitBreaker('test-upstream', failure_threshold=3, recovery_timeout=30)
+    yield breaker
+    circuit_breaker._breakers.pop('test-upstream', None)
+
+
+def fail():
+    raise ConnectionError("upstream down")
+
+
+def expire(breaker):
+    """Move the breaker's open time back past the recovery timeout"""
+    breaker.opened_at -= breaker.recovery_timeout
+
+
+def test_opens_after_consecutive_failures_and_rejects_without_calling(breaker):
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == CLOSED
+    # A success resets the consecutive count
+    assert breaker.call(lambda: 'ok') == 'ok'
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(calls.append, 1)
+    assert calls == []
+    assert breaker.snapshot()['rejected'] == 1
+
+
+def test_half_open_trial_success_closes(breaker):
+    breaker.failures = 2
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    expire(breaker)
+
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # Only one trial call at a time while half-open
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert [(t['from'], t['to']) for t in breaker.snapshot()['transitions']] == [
+        (CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)
+    ]
+
+
+def test_half_open_trial_failure_reopens(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    expire(breaker)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 'ok')
+
+
+def test_cancelled_async_trial_gives_back_its_slot(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    expire(breaker)
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.ensure_future(breaker.call_async(slow))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await breaker.call_async(asyncio.sleep, 0, 'ok')
+
+    assert asyncio.run(run()) == 'ok'
+    assert breaker.state == CLOSED
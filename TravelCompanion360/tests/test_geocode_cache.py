@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from db import db
+from models import GeocodeCache
+from utils import geocode_cache, maps_helper
+
+
+def test_batch_lookup_reads_the_database_tier_in_one_query(app_context, monkeypatch):
+    now = datetime.utcnow()
+    db.session.add_all([
+        GeocodeCache(location_key=f'city {i}', lat=float(i), lng=float(-i), fetched_at=now) for i in range(20)
+    ] + [
+        GeocodeCache(location_key='nowhere', lat=None, lng=None, fetched_at=now),
+        GeocodeCache(location_key='old town', lat=1.0, lng=2.0, fetched_at=now - timedelta(days=365)),
+    ])
+    db.session.commit()
+    geocode_cache._memory.clear()
+
+    fetched = []
+    monkeypatch.setattr(maps_helper, '_resolve_coordinates', lambda location: fetched.append(location) or None)
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        locations = [f'City {i}' for i in range(20)] + ['Nowhere', 'Old Town', 'Atlantis']
+        results = maps_helper.get_coordinates_batch(locations)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert len([s for s in statements if 'geocode_cache' in s]) == 1
+    assert results['City 3'] == {'lat': 3.0, 'lng': -3.0}
+    assert results['Nowhere'] is None
+    # Expired and unknown places are fetched from the API
+    assert sorted(fetched) == ['Atlantis', 'Old Town']
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+import pytest
+
+from db import db
+from models import Booking, Hotel, User
+from utils import openai_helper
+from utils.hotel_search import find_hotels
+
+
+@pytest.fixture
+def openai_down(monkeypatch):
+    def fail(*args):
+        raise RuntimeError('quota exceeded')
+    monkeypatch.setattr(openai_helper, 'OPENAI_API_KEY', 'test')
+    monkeypatch.setattr(openai_helper, 'get_cached_recommendations', fail)
+
+
+def test_fallback_recommendations_create_no_hotels(app_context, openai_down):
+    results = find_hotels('Atlantis', 200)
+
+    assert results and all(hotel['fallback'] and hotel['id'] is None for hotel in results)
+    assert Hotel.query.count() == 0
+
+
+def test_only_booked_recommendations_are_stored(app_context):
+    user = User(username='guest', email='guest@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    check_in = date.today() + timedelta(days=3)
+
+    fallback = openai_helper.get_fallback_hotel_recommendations('Lisbon', 150, 1)[0]
+    recommended = {'name': 'Casa Azul', 'location': 'Alfama, Lisbon', 'price': 120, 'rating': 4.5}
+    client = app_context.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['hotel_recommendations'] = [dict(fallback, id=None), dict(recommended, id=None, fallback=False)]
+
+    stay = {'check_in_date': check_in.isoformat(), 'check_out_date': (check_in + timedelta(days=2)).isoformat()}
+    client.post('/book_hotel/recommended/0', data=stay)
+    assert Hotel.query.count() == 0
+
+    client.post('/book_hotel/recommended/1', data=stay)
+    client.post('/book_hotel/recommended/1', data=stay)
+    hotel = Hotel.query.one()
+    assert (hotel.name, hotel.location, hotel.price_per_night) == ('Casa Azul', 'Alfama, Lisbon', 120)
+    assert Booking.query.filter_by(hotel_id=hotel.id).count() == 2
@@ -0,0 +1,77 @@
+import random
+from datetime import date, timedelta
+
+from db import db
+from models import Booking, Hotel, RoomInventory, User
+from utils.booking import book_stay, cancel_bookings
+from utils.inventory import HotelInventory, load_inventory
+
+
+def naive_free_rooms(nights, total_rooms, start, days):
+    booked = {(room, night) for room, night in nights}
+    return [
+        total_rooms - sum((room, start + timedelta(days=i)) in booked for room in range(1, total_rooms + 1))
+        for i in range(days)
+    ]
+
+
+def test_free_rooms_per_night_matches_a_per_night_count():
+    rng = random.Random(7)
+    start = date(2025, 1, 1)
+    # Up to 37 rooms makes the bit-sliced counter carry through six bit planes
+    for total_rooms in (1, 3, 8, 37):
+        nights = {
+            (rng.randint(1, total_rooms), start + timedelta(days=rng.randint(-5, 60)))
+            for _ in range(total_rooms * 20)
+        }
+        inventory = HotelInventory.from_nights(1, total_rooms, nights)
+        for window_start, days in ((start, 30), (start - timedelta(days=10), 90), (start + timedelta(days=59), 5)):
+            assert inventory.free_rooms_per_night(window_start, window_start + timedelta(days=days)) == \
+                naive_free_rooms(nights, total_rooms, window_start, days)
+
+
+def test_free_rooms_per_night_fully_booked_and_empty_range():
+    start = date(2025, 3, 1)
+    nights = [(room, start + timedelta(days=i)) for room in (1, 2, 3) for i in range(2)]
+    inventory = HotelInventory.from_nights(1, 3, nights)
+    assert inventory.free_rooms_per_night(start, start + timedelta(days=3)) == [0, 0, 3]
+    assert inventory.free_rooms_per_night(start, start) == []
+    assert HotelInventory(1, 4, None).free_rooms_per_night(start, start + timedelta(days=2)) == [4, 4]
+
+
+def test_booking_and_cancelling_keep_the_bitmaps_in_step(app_context):
+    start = date.today() + timedelta(days=5)
+    user = User(username='guest', email='guest@example.com', password_hash='x')
+    hotel = Hotel(name='Bitmap Hotel', location='Rome', price_per_night=80, total_rooms=3)
+    db.session.add_all([user, hotel])
+    db.session.commit()
+
+    first = book_stay(hotel, user.id, start, start + timedelta(days=3))
+    second = book_stay(hotel, user.id, start + timedelta(days=1), start + timedelta(days=2))
+    assert (first.room_number, second.room_number) == (1, 2)
+    version = hotel.inventory_version
+
+    inventory = load_inventory(hotel)
+    assert inventory.free_rooms_per_night(start, start + timedelta(days=4)) == [2, 1, 2, 3]
+
+    cancel_bookings(Booking.id == first.booking.id)
+    assert hotel.inventory_version > version
+    inventory = load_inventory(hotel)
+    assert inventory.free_rooms_per_night(start, start + timedelta(days=4)) == [3, 2, 3, 3]
+    assert inventory.rooms.get(1, 0) == 0
+    assert RoomInventory.query.filter_by(hotel_id=hotel.id).count() == 2
+
+
+def test_inventory_version_is_incremented_in_the_database(app_context):
+    from sqlalchemy import update
+    from utils.inventory import bump_inventory_version
+
+    hotel = Hotel(name='Version Hotel', location='Oslo', price_per_night=90, inventory_version=1)
+    db.session.add(hotel)
+    db.session.commit()
+    # Another worker bumps the version after this one read the hotel
+    with db.engine.begin() as conn:
+        conn.execute(update(Hotel).where(Hotel.id == hotel.id).values(inventory_version=2))
+
+    bump_inventory_version(hotel)
+    assert hotel.inventory_version == 3
@@ -0,0 +1,64 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import inspect, select
+from sqlalchemy.dialects import mysql
+
+from db import db
+from models import Hotel
+from utils import migrations
+from utils.migrations import MIGRATIONS, current_version, upgrade
+
+
+@pytest.fixture
+def fresh_app(tmp_path):
+    """An app on an empty database that nothing has migrated yet"""
+    from app import create_app
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp_path, 'fresh.db')}"})
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_upgrade_builds_the_schema_the_models_expect(fresh_app):
+    applied = upgrade()
+
+    assert applied == [(version, name) for version, name, _ in MIGRATIONS]
+    assert current_version() == MIGRATIONS[-1][0]
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        assert {column['name'] for column in inspector.get_columns(table.name)} == set(table.columns.keys()), table.name
+        expected = {index.name for index in table.indexes}
+        assert expected <= {index['name'] for index in inspector.get_indexes(table.name)}, table.name
+    assert upgrade() == []
+
+
+def test_status_lists_applied_and_pending_migrations(fresh_app):
+    upgrade(target=2)
+    result = fresh_app.test_cli_runner().invoke(args=['db', 'status'])
+
+    assert result.exit_code == 0
+    states = [line.split()[-1] for line in result.output.splitlines()]
+    assert states == ['applied' if version <= 2 else 'pending' for version, _, _ in MIGRATIONS]
+    assert current_version() == 2
+
+
+def test_check_plans_passes_on_a_migrated_database(fresh_app):
+    upgrade()
+    result = fresh_app.test_cli_runner().invoke(args=['db', 'check-plans'])
+
+    assert result.exit_code == 0, result.output
+    assert 'FULL SCAN' not in result.output
+
+
+def test_check_plans_reports_other_databases_as_unsupported(fresh_app, monkeypatch):
+    lines, scans = migrations._full_scans(SimpleNamespace(dialect=mysql.dialect()), select(Hotel.id))
+    assert scans is None and lines
+
+    monkeypatch.setattr(migrations, 'check_query_plans', lambda: {'room window': (lines, scans)})
+    result = fresh_app.test_cli_runner().invoke(args=['db', 'check-plans'])
+    assert result.exit_code == 0
+    assert 'unsupported  room window' in result.output
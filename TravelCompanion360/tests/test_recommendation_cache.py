@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from utils import recommendation_cache as cache
+from utils.cache import normalize_location
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache._cache.clear()
+    cache._stats.clear()
+    yield
+    cache._cache.clear()
+
+
+class Upstream:
+    """Fake model returning hotels at a quarter, half and full of the asked budget"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, destination, budget, num_results):
+        self.calls.append(budget)
+        return [{'name': f'{destination} {share}', 'price': budget * share} for share in (0.25, 0.5, 1)]
+
+
+def expire(destination, bucket, num_results, by):
+    key = (normalize_location(destination), bucket, num_results)
+    hotels, _ = cache._cache.peek(key)
+    cache._cache._data[key] = (hotels, time.monotonic() - by)
+
+
+def wait_for_refresh():
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_budgets_in_one_band_share_a_fetch_and_are_filtered_to_the_exact_budget():
+    upstream = Upstream()
+    first = cache.get_cached_recommendations('Paris', 110, 5, upstream)
+    second = cache.get_cached_recommendations(' paris ', 120, 5, upstream)
+
+    # Both budgets fall in the $100-125 band, fetched once for its top
+    assert upstream.calls == [125]
+    assert [hotel['price'] for hotel in first] == [31.25, 62.5]
+    assert [hotel['price'] for hotel in second] == [31.25, 62.5]
+    assert cache.get_cache_stats()['hits'] == 1
+
+    cache.get_cached_recommendations('Paris', 130, 5, upstream)
+    assert upstream.calls == [125, 150]
+
+
+def test_stale_entry_is_served_while_it_is_refreshed():
+    upstream = Upstream()
+    cache.get_cached_recommendations('Rome', 100, 5, upstream)
+    expire('Rome', 100, 5, by=10)
+
+    stale = cache.get_cached_recommendations('Rome', 100, 5, upstream)
+    assert [hotel['price'] for hotel in stale] == [25, 50, 100]
+    wait_for_refresh()
+    assert upstream.calls == [100, 100]
+    assert cache.get_cache_stats()['stale_hits'] == 1
+    assert cache.get_cache_stats()['refreshes'] == 1
+
+    cache.get_cached_recommendations('Rome', 100, 5, upstream)
+    assert cache.get_cache_stats()['hits'] == 1
+
+
+def test_entry_past_the_stale_window_is_fetched_again():
+    upstream = Upstream()
+    cache.get_cached_recommendations('Oslo', 100, 5, upstream)
+    expire('Oslo', 100, 5, by=cache.RECOMMENDATION_STALE_TTL + 10)
+
+    cache.get_cached_recommendations('Oslo', 100, 5, upstream)
+    assert upstream.calls == [100, 100]
+    assert cache.get_cache_stats()['misses'] == 2
+
+
+def test_exact_budget_fallback_is_cached():
+    def upstream(destination, budget, num_results):
+        upstream.calls.append(budget)
+        # Everything costs $20 more than asked
+        return [{'name': 'Pricey', 'price': budget + 20}] if budget == 125 else [{'name': 'Fits', 'price': budget}]
+    upstream.calls = []
+
+    for _ in range(3):
+        assert cache.get_cached_recommendations('Lima', 105, 5, upstream) == [{'name': 'Fits', 'price': 105}]
+    assert upstream.calls == [125, 105]
@@ -0,0 +1,34 @@
+from werkzeug.security import generate_password_hash
+
+from db import db
+from models import User
+
+
+def session_id(client, app):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return cookie.value if cookie else None
+
+
+def test_login_and_logout_give_the_session_a_new_id(app_context):
+    app = app_context
+    backend = app.session_interface.backend
+    db.session.add(User(username='guest', email='guest@example.com', password_hash=generate_password_hash('secret')))
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['hotel_recommendations'] = []
+    planted = session_id(client, app)
+    assert backend.load(planted) is not None
+
+    response = client.post('/login', data={'email': 'guest@example.com', 'password': 'secret'})
+    assert response.status_code == 302
+    logged_in = session_id(client, app)
+    assert logged_in not in (None, planted)
+    assert backend.load(planted) is None
+    data, _ = backend.load(logged_in)
+    assert data['_user_id'] and 'hotel_recommendations' in data
+
+    client.get('/logout')
+    assert session_id(client, app) != logged_in
+    assert backend.load(logged_in) is None
@@ -0,0 +1,178 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import Counter, OrderedDict
+
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "86400"))
+# Cosine similarity (0-1) a new question needs with a cached one to reuse its answer
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.85"))
+
+# Words that don't change what is being asked. Question words ("when", "what",
+# "where") are kept: "when to visit Tokyo" and "what to visit in Tokyo" differ.
+STOPWORDS = frozenset("""
+    a an the to in on at of for from by with and or is are was be been am
+    i me my we us our you your it its this that these those there
+    do does did can could would should will shall may might
+    please tell give some any really very just
+""".split())
+
+
+def tokenize(text):
+    """Lowercase, strip punctuation and stopwords and fold simple plurals"""
+    terms = []
+    text = re.sub(r"['\u2019]s\b", "", text.lower())
+    for word in re.findall(r"[a-z0-9]+", text):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class _Entry:
+    __slots__ = ("terms", "answer", "expires_at")
+
+    def __init__(self, terms, answer, expires_at):
+        self.terms = terms
+        self.answer = answer
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+    """
+    Size-bounded LRU of answers looked up by TF-IDF cosine similarity.
+
+    Document frequencies come from the cached questions themselves, so words
+    that are rare among them (usually the place names) weigh the most, and an
+    inverted index limits scoring to entries sharing at least one term.
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # normalized question -> _Entry, least recently used first
+        self._index = {}  # term -> normalized questions containing it
+        self._df = Counter()
+        self._lock = threading.Lock()
+
+    def _idf(self, term):
+        return math.log((len(self._entries) + 1) / (self._df[term] + 1)) + 1
+
+    def _vector(self, terms):
+        vector = {term: count * self._idf(term) for term, count in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return vector, norm
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for term in entry.terms:
+            self._df[term] -= 1
+            if not self._df[term]:
+                del self._df[term]
+            keys = self._index[term]
+            keys.discard(key)
+            if not keys:
+                del self._index[term]
+
+    def get(self, question):
+        """
+        Return the cached answer to the most similar question, or None
+
+        Args:
+            question (str): The user's message
+
+        Returns:
+            str: An answer whose question scores at least ``threshold``, or None
+        """
+        terms = Counter(tokenize(question))
+        if not terms:
+            return None
+
+        with self._lock:
+            now = time.monotonic()
+            query, query_norm = self._vector(terms)
+            candidates = set()
+            for term in terms:
+                candidates.update(self._index.get(term, ()))
+
+            best_key, best_score = None, 0.0
+            for key in candidates:
+                entry = self._entries[key]
+                if entry.expires_at <= now:
+                    continue
+                vector, norm = self._vector(entry.terms)
+                dot = sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+                score = dot / (query_norm * norm)
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key].answer
+
+    def set(self, question, answer):
+        terms = Counter(tokenize(question))
+        if not terms:
+            return
+        key = " ".join(sorted(terms.elements()))
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(terms, answer, time.monotonic() + self.ttl)
+            for term in terms:
+                self._df[term] += 1
+                self._index.setdefault(term, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            self._df.clear()
+
+    def stats(self):
+        """Return hit/miss counters, the hit rate and the current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'threshold': self.threshold
+            }
+
+
+_cache = SemanticCache()
+
+
+def is_cacheable(conversation_history=None, summary=None):
+    """Only first-turn questions are answered from the cache; later ones depend on the conversation"""
+    return ANSWER_CACHE_ENABLED and not conversation_history and not summary
+
+
+def lookup(question):
+    return _cache.get(question)
+
+
+def store(question, answer):
+    _cache.set(question, answer)
+
+
+def get_cache_stats():
+    """Return hit-rate metrics for the assistant answer cache in this process"""
+    return _cache.stats()
@@ -0,0 +1,191 @@
+import os
+import random
+import time
+import logging
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from sqlalchemy import and_, select, text, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from db import db
+from models import Booking, Hotel, RoomAvailability
+from utils.inventory import RoomConflict, assign_room, ensure_inventory, release_nights, reserve_room
+from utils.occupancy import adjust_availability, adjust_occupancy, stay_nights
+
+# 'lock' serializes bookings per hotel (SELECT ... FOR UPDATE on PostgreSQL,
+# BEGIN IMMEDIATE on SQLite); 'none' relies on the unique_room_date constraint
+# and retries alone.
+BOOKING_LOCK_MODE = os.environ.get("BOOKING_LOCK_MODE", "lock")
+BOOKING_MAX_RETRIES = int(os.environ.get("BOOKING_MAX_RETRIES", "3"))
+
+BookingResult = namedtuple('BookingResult', ['booking', 'room_number', 'status'])
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_booking_stats():
+    """Return counters for booking attempts, successes and conflicts in this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def lock_hotel(hotel):
+    """
+    Hold a write lock on the hotel until the current transaction ends
+
+    Concurrent bookings for the same hotel queue behind each other, while
+    bookings for different hotels (on PostgreSQL) proceed in parallel. The
+    hotel is refreshed so availability is checked against committed data.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        dbapi_connection = db.session.connection().connection.dbapi_connection
+        if not dbapi_connection.in_transaction:
+            db.session.execute(text('BEGIN IMMEDIATE'))
+        else:
+            # A write is already pending; a no-op UPDATE takes the write lock
+            db.session.execute(
+                update(Hotel).where(Hotel.id == hotel.id).values(last_updated=Hotel.last_updated)
+            )
+        db.session.refresh(hotel)
+    else:
+        db.session.query(Hotel).filter_by(id=hotel.id).with_for_update().populate_existing().one()
+
+
+def book_stay(hotel, user_id, check_in, check_out):
+    """
+    Book the first free room in a hotel, retrying on write conflicts
+
+    A conflict (another worker claimed the same room-night, or the database
+    was locked) rolls the transaction back and tries again, skipping the
+    room that collided.
+
+    Args:
+        hotel (Hotel): The hotel to book
+        user_id (int): The user making the booking
+        check_in (date): First night of the stay
+        check_out (date): Departure day (not a booked night)
+
+    Returns:
+        BookingResult: status is 'confirmed', 'sold_out' or 'conflict'
+    """
+    hotel_id = hotel.id
+    tried_rooms = set()
+
+    for attempt in range(BOOKING_MAX_RETRIES + 1):
+        _count('attempts')
+        room_number = None
+        try:
+            if BOOKING_LOCK_MODE == 'lock':
+                lock_hotel(hotel)
+
+            if not hotel.is_available(check_in, check_out):
+                db.session.rollback()
+                _count('sold_out')
+                return BookingResult(None, None, 'sold_out')
+
+            booking = Booking(
+                user_id=user_id,
+                hotel_id=hotel_id,
+                booking_type='hotel',
+                check_in_date=check_in,
+                check_out_date=check_out,
+                status='confirmed'
+            )
+            db.session.add(booking)
+            db.session.flush()  # Get booking ID without committing
+
+            room_number = assign_room(hotel, booking.id, check_in, check_out, exclude=tried_rooms)
+            if room_number is None:
+                db.session.rollback()
+                _count('sold_out')
+                return BookingResult(None, None, 'sold_out')
+
+            # Record the stay in the hotel's occupancy bitmaps and nightly counters
+            nights = stay_nights(check_in, check_out)
+            reserve_room(hotel, room_number, check_in, check_out)
+            adjust_occupancy(hotel_id, nights, 1)
+            adjust_availability(hotel, nights, 1)
+            db.session.commit()
+            _count('confirmed')
+            return BookingResult(booking, room_number, 'confirmed')
+
+        except (IntegrityError, OperationalError, RoomConflict) as e:
+            db.session.rollback()
+            _count('conflicts')
+            if room_number is not None:
+                tried_rooms.add(room_number)
+            logging.warning(f"Booking conflict at hotel {hotel_id} (attempt {attempt + 1}): {e.__class__.__name__}")
+            # Jittered backoff so colliding workers do not retry in lockstep
+            time.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+
+    logging.error(f"Giving up booking hotel {hotel_id} after {BOOKING_MAX_RETRIES + 1} attempts")
+    return BookingResult(None, None, 'conflict')
+
+
+def cancel_bookings(*criteria):
+    """
+    Cancel every booking matching the criteria in one transaction
+
+    The room-nights of all the bookings are freed with one UPDATE and their
+    statuses set with another; bitmaps and counters are then adjusted once
+    per hotel, so the cost does not grow with the number of bookings or
+    nights.
+
+    Only confirmed bookings are cancelled: completed stays keep their status
+    and their nights stay counted.
+
+    Args:
+        *criteria: Filters on Booking, e.g. ``Booking.id.in_(ids)``
+
+    Returns:
+        list: Ids of the bookings that were cancelled
+    """
+    active = and_(Booking.status == 'confirmed', *criteria)
+    rows = db.session.execute(select(Booking.id, Booking.hotel_id).where(active)).all()
+    if not rows:
+        return []
+
+    hotel_ids = sorted({row.hotel_id for row in rows if row.hotel_id is not None})
+    hotels = Hotel.query.filter(Hotel.id.in_(hotel_ids)).order_by(Hotel.id).all() if hotel_ids else []
+    for hotel in hotels:
+        # Lock in id order so concurrent bulk cancellations can't deadlock
+        if BOOKING_LOCK_MODE == 'lock':
+            lock_hotel(hotel)
+        # Built from the rows as they are before this cancellation
+        ensure_inventory(hotel)
+
+    release = update(RoomAvailability).where(
+        RoomAvailability.booking_id.in_(select(Booking.id).where(active))
+    ).values(is_available=True, booking_id=None).execution_options(synchronize_session=False)
+    columns = (RoomAvailability.hotel_id, RoomAvailability.room_number, RoomAvailability.date)
+    if db.session.get_bind().dialect.update_returning:
+        nights = db.session.execute(release.returning(*columns)).all()
+    else:
+        nights = db.session.execute(select(*columns).where(release.whereclause)).all()
+        db.session.execute(release)
+
+    db.session.execute(
+        update(Booking).where(active).values(status='cancelled').execution_options(synchronize_session=False)
+    )
+
+    by_hotel = defaultdict(list)
+    for hotel_id, room_number, night in nights:
+        by_hotel[hotel_id].append((room_number, night))
+    for hotel in hotels:
+        released = by_hotel.get(hotel.id)
+        if released:
+            dates = [night for _, night in released]
+            release_nights(hotel, released)
+            adjust_occupancy(hotel.id, dates, -1)
+            adjust_availability(hotel, dates, -1)
+
+    db.session.commit()
+    _count('cancelled')
+    return [row.id for row in rows]
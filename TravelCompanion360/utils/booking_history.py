@@ -0,0 +1,88 @@
+import os
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import joinedload
+
+from db import db
+from models import Booking
+
+PROFILE_PAGE_SIZE = int(os.environ.get("PROFILE_PAGE_SIZE", "20"))
+
+BOOKING_STATUSES = ('confirmed', 'cancelled', 'completed')
+
+
+def encode_cursor(booking):
+    """Position of a booking in the history, for the next page's ``before`` parameter"""
+    return f"{booking.booking_date.isoformat()}_{booking.id}"
+
+
+def decode_cursor(cursor):
+    """
+    Parse a cursor made by encode_cursor()
+
+    Returns:
+        tuple: (booking_date, id), or None if the cursor is missing or malformed
+    """
+    if not cursor:
+        return None
+    try:
+        booking_date, booking_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(booking_date), int(booking_id)
+    except ValueError:
+        return None
+
+
+def get_booking_page(user_id, status=None, before=None, limit=None):
+    """
+    Load one page of a user's bookings, newest first
+
+    Uses keyset pagination on (booking_date, id), so later pages cost the same
+    as the first, and loads each booking's hotel or car rental in the same query.
+
+    Args:
+        user_id (int): Whose bookings to load
+        status (str, optional): Only bookings with this status
+        before (tuple, optional): (booking_date, id) of the last booking on the previous page
+        limit (int, optional): Page size, defaults to PROFILE_PAGE_SIZE
+
+    Returns:
+        tuple: (list of bookings, cursor for the next page or None)
+    """
+    limit = limit or PROFILE_PAGE_SIZE
+    query = Booking.query.options(
+        joinedload(Booking.hotel),
+        joinedload(Booking.car_rental)
+    ).filter(Booking.user_id == user_id)
+
+    if status:
+        query = query.filter(Booking.status == status)
+    if before:
+        booking_date, booking_id = before
+        query = query.filter(or_(
+            Booking.booking_date < booking_date,
+            and_(Booking.booking_date == booking_date, Booking.id < booking_id)
+        ))
+
+    bookings = query.order_by(Booking.booking_date.desc(), Booking.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(bookings[limit - 1]) if len(bookings) > limit else None
+    return bookings[:limit], next_cursor
+
+
+def get_booking_counts(user_id):
+    """
+    Count a user's bookings by type and by status in one grouped query
+
+    Returns:
+        dict: {'total', 'by_type': Counter, 'by_status': Counter}
+    """
+    rows = db.session.query(Booking.booking_type, Booking.status, func.count(Booking.id)).filter(
+        Booking.user_id == user_id
+    ).group_by(Booking.booking_type, Booking.status).all()
+
+    by_type, by_status = Counter(), Counter()
+    for booking_type, status, count in rows:
+        by_type[booking_type] += count
+        by_status[status] += count
+    return {'total': sum(by_type.values()), 'by_type': by_type, 'by_status': by_status}
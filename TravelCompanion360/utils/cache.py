@@ -0,0 +1,77 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with optional per-entry expiry.
+
+    Expired entries are treated as misses by get() but are kept until they are
+    evicted, so callers can still peek() at a stale value.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value, or ``default`` if it is missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """
+        Return ``(value, expires_at)`` for a key even if it has expired
+
+        Returns:
+            tuple: The value and its monotonic expiry time (None if it never
+            expires), or None if the key is not cached
+        """
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, value, ttl=None):
+        """Cache a value, using the cache's default TTL unless one is given"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove a key and return its value"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+
+def normalize_location(location):
+    """Normalize a location string so trivially different spellings share a cache entry"""
+    key = re.sub(r"\s*,\s*", ", ", " ".join(location.lower().split()))
+    return key.strip(" ,.")[:255]
@@ -0,0 +1,118 @@
+import os
+import re
+import logging
+import functools
+
+# Token budget for everything sent with a chat request: system prompt, summary, history and the new message
+CHAT_CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", "2000"))
+# Stored history above this is folded into the conversation's rolling summary
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", "1200"))
+CHAT_SUMMARY_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", "250"))
+
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Rough stand-in for a BPE tokenizer: words split into 4-character pieces, and punctuation
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logging.info(f"tiktoken unavailable, approximating token counts: {e}")
+        return None
+
+
+def count_tokens(text):
+    """Count the tokens in a piece of text without calling the API"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def message_tokens(message):
+    return count_tokens(message.get("content")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def split_history(history, budget):
+    """
+    Split a history into the older messages that do not fit a token budget and the recent ones that do
+
+    Messages are kept newest first, and a user message is never kept without
+    the assistant reply that followed it (or the other way around).
+
+    Returns:
+        tuple: (older messages, recent messages), both oldest first
+    """
+    used = 0
+    start = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        used += message_tokens(history[index])
+        if used > budget:
+            break
+        start = index
+    # Don't start the kept history in the middle of a turn
+    while start < len(history) and history[start]["role"] == "assistant":
+        start += 1
+    return history[:start], history[start:]
+
+
+def compact_history(history):
+    """
+    Decide which stored messages to fold into the rolling summary
+
+    Nothing is folded until the history exceeds CHAT_HISTORY_TOKENS; then it
+    is cut to half of that, so a summary is written every few turns rather
+    than on every one.
+
+    Returns:
+        tuple: (messages to summarize, messages to keep), both oldest first
+    """
+    if sum(message_tokens(m) for m in history) <= CHAT_HISTORY_TOKENS:
+        return [], history
+    return split_history(history, CHAT_HISTORY_TOKENS // 2)
+
+
+def build_context(system_prompt, summary, history, message, budget=None):
+    """
+    Build the messages for a chat request within a token budget
+
+    The system prompt and the new message are always sent. The rolling summary
+    of earlier turns is added to the system message, and the remaining budget
+    is filled with the most recent history.
+
+    Args:
+        system_prompt (str): Instructions for the assistant
+        summary (str): Summary of turns no longer kept verbatim, may be empty
+        history (list): Stored {"role", "content"} messages, oldest first
+        message (str): The user's new message
+        budget (int, optional): Overrides CHAT_CONTEXT_TOKENS
+
+    Returns:
+        list: Messages for the chat completions API
+    """
+    system = system_prompt
+    if summary:
+        system = f"{system_prompt}\n\nSummary of the conversation so far:\n{summary}"
+    system_message = {"role": "system", "content": system}
+    user_message = {"role": "user", "content": message}
+
+    remaining = (budget or CHAT_CONTEXT_TOKENS) - message_tokens(system_message) - message_tokens(user_message)
+    _, recent = split_history(history or [], max(remaining, 0))
+    return [system_message] + recent + [user_message]
+
+
+def truncate_tokens(text, limit):
+    """Cut text down to about ``limit`` tokens, keeping the end"""
+    if count_tokens(text) <= limit:
+        return text
+    words = text.split()
+    while words and count_tokens(" ".join(words)) > limit:
+        words = words[max(1, len(words) // 10):]
+    return " ".join(words)
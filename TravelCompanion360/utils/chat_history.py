@@ -0,0 +1,57 @@
+import json
+import uuid
+
+from flask import session
+
+from db import db
+from models import ChatConversation
+from utils.chat_context import compact_history
+
+
+def get_conversation_id():
+    """Return the current user's conversation id, starting a new conversation if needed"""
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid.uuid4().hex
+    return session['chat_id']
+
+
+def load_conversation(conversation_id):
+    """
+    Load the stored summary and messages of a conversation
+    
+    Args:
+        conversation_id (str): The conversation to load
+        
+    Returns:
+        tuple: (rolling summary or None, messages as {"role", "content"} dictionaries, oldest first)
+    """
+    conversation = db.session.get(ChatConversation, conversation_id)
+    if conversation is None:
+        return None, []
+    return conversation.summary, json.loads(conversation.messages)
+
+
+def save_conversation(conversation_id, messages, summary=None):
+    """
+    Store a conversation, folding older messages into its rolling summary
+    
+    Unlike the cookie session, this can be called after a streamed response
+    has started, so the finished reply is not lost.
+    
+    Args:
+        conversation_id (str): The conversation to store
+        messages (list): The full history including the latest turn
+        summary (str, optional): The summary the history was loaded with
+    """
+    older, messages = compact_history(messages)
+    if older:
+        from utils.openai_helper import summarize_conversation
+        summary = summarize_conversation(summary, older)
+    
+    conversation = db.session.get(ChatConversation, conversation_id)
+    if conversation is None:
+        conversation = ChatConversation(id=conversation_id)
+        db.session.add(conversation)
+    conversation.messages = json.dumps(messages)
+    conversation.summary = summary
+    db.session.commit()
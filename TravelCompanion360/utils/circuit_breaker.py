@@ -0,0 +1,137 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from utils.metrics import observe_upstream
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_breakers = {}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while its circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing upstream for a while and fail fast instead.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    every call raises CircuitOpenError without touching the upstream. Once
+    ``recovery_timeout`` seconds have passed it goes half-open and lets up to
+    ``half_open_max_calls`` trial calls through: a success closes it again,
+    a failure reopens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1, history=50):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_calls = 0
+        self.counts = {'successes': 0, 'failures': 0, 'rejected': 0}
+        self.transitions = deque(maxlen=history)
+        self._lock = threading.Lock()
+        _breakers[name] = self
+
+    def _transition(self, state):
+        logging.warning(f"Circuit breaker '{self.name}': {self.state} -> {state}")
+        self.transitions.append({'from': self.state, 'to': state, 'at': time.time()})
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state != CLOSED:
+            self.trial_calls = 0
+        else:
+            self.failures = 0
+
+    def allow_request(self):
+        """Return True if a call may go to the upstream now"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self.trial_calls < self.half_open_max_calls:
+                self.trial_calls += 1
+                return True
+            self.counts['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.counts['successes'] += 1
+            self.failures = 0
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.counts['failures'] += 1
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._transition(OPEN)
+
+    def call(self, fn, *args, **kwargs):
+        """Call ``fn`` through the breaker, raising CircuitOpenError while it is open"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            observe_upstream(self.name, 'error', time.perf_counter() - started)
+            self.record_failure()
+            raise
+        observe_upstream(self.name, 'ok', time.perf_counter() - started)
+        self.record_success()
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Await ``fn(*args, **kwargs)`` through the breaker"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        started = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            observe_upstream(self.name, 'error', time.perf_counter() - started)
+            self.record_failure()
+            raise
+        except BaseException:
+            # Cancelled: the call proved nothing, but give back a half-open trial slot
+            self.release_trial()
+            raise
+        observe_upstream(self.name, 'ok', time.perf_counter() - started)
+        self.record_success()
+        return result
+
+    def release_trial(self):
+        with self._lock:
+            if self.state == HALF_OPEN and self.trial_calls > 0:
+                self.trial_calls -= 1
+
+    def snapshot(self):
+        """Return the breaker's state, counters and recent transitions"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                **self.counts,
+                'transitions': list(self.transitions)
+            }
+
+
+def get_breakers():
+    """Return snapshots of every circuit breaker in this process"""
+    return [breaker.snapshot() for breaker in _breakers.values()]
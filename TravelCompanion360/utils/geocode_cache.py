@@ -0,0 +1,208 @@
+import os
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask import has_app_context
+from flask.cli import AppGroup
+
+from db import db, dialect_insert
+from models import GeocodeCache
+from utils.cache import LRUCache, normalize_location
+
+GEOCODE_CACHE_TTL = int(os.environ.get("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = int(os.environ.get("GEOCODE_NEGATIVE_TTL", "3600"))
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", "1024"))
+# Keys per IN (...) query when looking up a batch
+GEOCODE_LOOKUP_CHUNK = 500
+# Expired database entries are purged after this many writes
+GEOCODE_PURGE_EVERY = int(os.environ.get("GEOCODE_PURGE_EVERY", "1000"))
+
+# Returned by lookup() when neither tier has a fresh entry
+MISS = object()
+
+_memory = LRUCache(maxsize=GEOCODE_CACHE_SIZE)
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+        return _stats[key]
+
+
+def _ttl_for(coords):
+    return GEOCODE_CACHE_TTL if coords is not None else GEOCODE_NEGATIVE_TTL
+
+
+def lookup(location):
+    """
+    Look up a location in the in-process cache, then in the database
+
+    Args:
+        location (str): The location as entered by the user
+
+    Returns:
+        dict: Cached coordinates, None for a cached "not found", or MISS
+    """
+    key = normalize_location(location)
+
+    entry = _memory.get(key, MISS)
+    if entry is not MISS:
+        _count('memory_hits')
+        if entry is None:
+            _count('negative_hits')
+        return entry
+
+    if has_app_context():
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    GeocodeCache.__table__.select().where(GeocodeCache.location_key == key)
+                ).first()
+        except Exception as e:
+            logging.error(f"Error reading geocode cache: {e}")
+            row = None
+
+        if row is not None:
+            coords = _from_row(key, row)
+            if coords is not MISS:
+                return coords
+
+    _count('misses')
+    return MISS
+
+
+def _from_row(key, row):
+    """Return a database entry's coordinates, caching them in memory, or MISS if expired"""
+    coords = {"lat": row.lat, "lng": row.lng} if row.lat is not None else None
+    remaining = _ttl_for(coords) - (datetime.utcnow() - row.fetched_at).total_seconds()
+    if remaining <= 0:
+        return MISS
+    _memory.set(key, coords, ttl=remaining)
+    _count('db_hits')
+    if coords is None:
+        _count('negative_hits')
+    return coords
+
+
+def lookup_many(locations):
+    """
+    Look up several locations, reading the database tier with one IN query
+
+    Args:
+        locations (iterable): Locations as entered by the user
+
+    Returns:
+        dict: Normalized location -> cached coordinates or None, for hits only
+    """
+    found = {}
+    missing = []
+    for key in dict.fromkeys(normalize_location(location) for location in locations):
+        entry = _memory.get(key, MISS)
+        if entry is MISS:
+            missing.append(key)
+            continue
+        _count('memory_hits')
+        if entry is None:
+            _count('negative_hits')
+        found[key] = entry
+
+    if missing and has_app_context():
+        table = GeocodeCache.__table__
+        try:
+            with db.engine.connect() as conn:
+                rows = []
+                for start in range(0, len(missing), GEOCODE_LOOKUP_CHUNK):
+                    rows += conn.execute(table.select().where(
+                        table.c.location_key.in_(missing[start:start + GEOCODE_LOOKUP_CHUNK])
+                    )).all()
+        except Exception as e:
+            logging.error(f"Error reading geocode cache: {e}")
+            rows = []
+        for row in rows:
+            coords = _from_row(row.location_key, row)
+            if coords is not MISS:
+                found[row.location_key] = coords
+
+    for key in missing:
+        if key not in found:
+            _count('misses')
+    return found
+
+
+def store(location, coords):
+    """
+    Cache a geocoding result in both tiers
+
+    Args:
+        location (str): The location as entered by the user
+        coords (dict): Coordinates with lat and lng keys, or None for "not found"
+    """
+    key = normalize_location(location)
+    _memory.set(key, coords, ttl=_ttl_for(coords))
+
+    if not has_app_context():
+        return
+
+    values = {
+        'location_key': key,
+        'lat': coords['lat'] if coords else None,
+        'lng': coords['lng'] if coords else None,
+        'fetched_at': datetime.utcnow()
+    }
+    try:
+        # Written on its own connection so the request's session is untouched
+        with db.engine.begin() as conn:
+            stmt = dialect_insert(GeocodeCache)
+            if stmt is not None:
+                stmt = stmt.values(values)
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=[GeocodeCache.location_key],
+                    set_={k: stmt.excluded[k] for k in ('lat', 'lng', 'fetched_at')}
+                ))
+            else:
+                table = GeocodeCache.__table__
+                conn.execute(table.delete().where(table.c.location_key == key))
+                conn.execute(table.insert().values(values))
+    except Exception as e:
+        logging.error(f"Error writing geocode cache: {e}")
+        return
+
+    if _count('writes') % GEOCODE_PURGE_EVERY == 0:
+        try:
+            purge_expired()
+        except Exception as e:
+            logging.error(f"Error purging geocode cache: {e}")
+
+
+def purge_expired():
+    """Delete database entries older than their TTL and return how many were removed"""
+    now = datetime.utcnow()
+    table = GeocodeCache.__table__
+    with db.engine.begin() as conn:
+        removed = conn.execute(table.delete().where(
+            (table.c.lat.is_not(None) & (table.c.fetched_at < now - timedelta(seconds=GEOCODE_CACHE_TTL))) |
+            (table.c.lat.is_(None) & (table.c.fetched_at < now - timedelta(seconds=GEOCODE_NEGATIVE_TTL)))
+        )).rowcount
+    return removed
+
+
+def get_cache_stats():
+    """Return hit/miss counters for the geocoding cache in this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['memory_size'] = len(_memory)
+    return stats
+
+
+geocode_cli = AppGroup('geocode', help='Geocoding cache maintenance.')
+
+
+@geocode_cli.command('purge')
+def purge_command():
+    """Delete expired geocoding cache entries."""
+    click.echo(f"Purged {purge_expired()} expired geocode entries")
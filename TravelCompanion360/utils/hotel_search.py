@@ -0,0 +1,316 @@
+import os
+import asyncio
+import logging
+
+from sqlalchemy import and_, func, select, text
+
+from db import db
+from models import Hotel, HotelOccupancy, RoomAvailability
+from utils.cache import normalize_location
+
+# Serve /hotels from the Hotel table when it has at least this many matches
+HOTEL_SEARCH_MIN_RESULTS = int(os.environ.get("HOTEL_SEARCH_MIN_RESULTS", "3"))
+
+# Which location index the database has: 'fts5', 'trigram' or None (plain LIKE); looked up on first search
+_index_kind = None
+_index_checked = False
+
+_SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE hotel_fts USING fts5(location_key, content='hotel', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS hotel_fts_insert AFTER INSERT ON hotel BEGIN
+        INSERT INTO hotel_fts(rowid, location_key) VALUES (new.id, new.location_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS hotel_fts_delete AFTER DELETE ON hotel BEGIN
+        INSERT INTO hotel_fts(hotel_fts, rowid, location_key) VALUES ('delete', old.id, old.location_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS hotel_fts_update AFTER UPDATE OF location_key ON hotel BEGIN
+        INSERT INTO hotel_fts(hotel_fts, rowid, location_key) VALUES ('delete', old.id, old.location_key);
+        INSERT INTO hotel_fts(rowid, location_key) VALUES (new.id, new.location_key);
+    END""",
+    "INSERT INTO hotel_fts(hotel_fts) VALUES ('rebuild')",
+]
+
+_POSTGRES_TRIGRAM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_hotel_location_key_trgm ON hotel USING gin (location_key gin_trgm_ops)",
+]
+
+
+def create_search_index(conn):
+    """
+    Create the substring index over Hotel.location_key if the database supports one
+
+    SQLite gets an FTS5 trigram table kept in sync by triggers, PostgreSQL a
+    pg_trgm GIN index. Rows saved before location_key existed are backfilled.
+    Run by the migrations; safe to run again.
+
+    Args:
+        conn (Connection): Connection of the migration's transaction
+    """
+    global _index_checked
+
+    table = Hotel.__table__
+    for row in conn.execute(select(table.c.id, table.c.location).where(table.c.location_key.is_(None))).all():
+        conn.execute(table.update().where(table.c.id == row.id).values(location_key=normalize_location(row.location)))
+
+    dialect = conn.dialect.name
+    try:
+        if dialect == 'sqlite':
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'hotel_fts'")).first()
+            if not exists:
+                for statement in _SQLITE_FTS:
+                    conn.execute(text(statement))
+        elif dialect == 'postgresql':
+            # A failure must not abort the migration's transaction
+            with conn.begin_nested():
+                for statement in _POSTGRES_TRIGRAM:
+                    conn.execute(text(statement))
+    except Exception as e:
+        logging.error(f"Hotel search index unavailable, falling back to LIKE scans: {e}")
+    _index_checked = False
+
+
+def search_index_kind():
+    """Return which substring index create_search_index() set up: 'fts5', 'trigram' or None"""
+    global _index_kind, _index_checked
+
+    if not _index_checked:
+        dialect = db.engine.dialect.name
+        with db.engine.connect() as conn:
+            if dialect == 'sqlite':
+                found = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'hotel_fts'")).first()
+                _index_kind = 'fts5' if found else None
+            elif dialect == 'postgresql':
+                found = conn.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_hotel_location_key_trgm'")).first()
+                _index_kind = 'trigram' if found else None
+        _index_checked = True
+    return _index_kind
+
+
+def _search_term(destination):
+    # "Paris, France" should match "Le Marais, Paris": search for the place itself
+    return normalize_location(destination).split(',')[0].strip()
+
+
+def search_hotels(destination, budget, limit=5):
+    """
+    Find stored hotels in a destination within budget, best rated first
+
+    Args:
+        destination (str): The destination city or location
+        budget (float): Maximum price per night in USD
+        limit (int): Maximum number of hotels to return
+
+    Returns:
+        list: Hotels in the same format as get_hotel_recommendations()
+    """
+    term = _search_term(destination)
+    if not term:
+        return []
+
+    query = select(
+        Hotel.id, Hotel.name, Hotel.location, Hotel.price_per_night, Hotel.rating, Hotel.description
+    ).where(Hotel.price_per_night <= budget, _location_filter(term))
+
+    rows = db.session.execute(
+        query.order_by(Hotel.rating.desc(), Hotel.price_per_night).limit(limit)
+    ).all()
+    return [_to_result(row) for row in rows]
+
+
+def _location_filter(term):
+    # Trigram indexes need at least three characters to narrow anything down
+    if search_index_kind() == 'fts5' and len(term) >= 3:
+        phrase = '"' + term.replace('"', '""') + '"'
+        return Hotel.id.in_(text("SELECT rowid FROM hotel_fts WHERE hotel_fts MATCH :phrase").bindparams(phrase=phrase))
+    return Hotel.location_key.contains(term, autoescape=True)
+
+
+def _to_result(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'location': row.location,
+        'price': row.price_per_night,
+        'rating': row.rating or 0,
+        'features': [],
+        'description': row.description
+    }
+
+
+def search_available_hotels(destination, budget, check_in, check_out, limit=None):
+    """
+    Find hotels in a destination within budget with at least one room free every night of a stay
+
+    Free rooms are computed for every candidate hotel in one grouped query:
+    total rooms minus the busiest night's booked count in hotel_occupancy.
+    This counts rooms, not room numbers: every night has a free room, but not
+    necessarily the same one. book_stay() decides whether a single room is
+    free for the whole stay when the hotel is booked.
+
+    Args:
+        destination (str): The destination city or location
+        budget (float): Maximum price per night in USD
+        check_in (date): First night of the stay
+        check_out (date): Departure day (not a booked night)
+        limit (int, optional): Maximum number of hotels to return
+
+    Returns:
+        list: Hotels best rated first, each with ``free_rooms``, the fewest
+        rooms free on any night of the stay (at least 1)
+    """
+    from utils.inventory import ensure_inventory
+
+    term = _search_term(destination)
+    if not term:
+        return []
+    candidates = (Hotel.price_per_night <= budget, _location_filter(term))
+
+    # Hotels booked before the occupancy counters existed get them built once;
+    # unbuilt hotels without bookings simply have no booked nights
+    legacy = Hotel.query.filter(
+        Hotel.inventory_version.is_(None),
+        Hotel.room_availability.any(RoomAvailability.is_available == False),
+        *candidates
+    ).all()
+    if legacy:
+        for hotel in legacy:
+            ensure_inventory(hotel)
+        db.session.commit()
+
+    free_rooms = (func.coalesce(Hotel.total_rooms, 0) - func.coalesce(func.max(HotelOccupancy.booked_rooms), 0)).label('free_rooms')
+    query = select(
+        Hotel.id, Hotel.name, Hotel.location, Hotel.price_per_night, Hotel.rating, Hotel.description, free_rooms
+    ).outerjoin(HotelOccupancy, and_(
+        HotelOccupancy.hotel_id == Hotel.id,
+        HotelOccupancy.date >= check_in,
+        HotelOccupancy.date < check_out
+    )).where(*candidates).group_by(Hotel.id).having(free_rooms > 0).order_by(
+        Hotel.rating.desc(), Hotel.price_per_night
+    )
+    if limit:
+        query = query.limit(limit)
+
+    return [dict(_to_result(row), free_rooms=row.free_rooms) for row in db.session.execute(query)]
+
+
+def _number(value, default=None):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _hotel_fields(rec):
+    """Return (name, location, price) of a recommendation, or None if one is missing"""
+    if not isinstance(rec, dict):
+        return None
+    name = str(rec.get('name') or '').strip()[:100]
+    location = str(rec.get('location') or '').strip()[:100]
+    price = _number(rec.get('price'))
+    if not (name and location and price is not None):
+        return None
+    return name, location, price
+
+
+def prepare_recommendations(recommendations):
+    """
+    Ready ChatGPT recommendations for the /hotels page without storing them
+
+    Recommendations arrive numbered 1, 2, ..., which would point at unrelated
+    stored hotels, so their ids are dropped. A recommended hotel becomes a
+    Hotel row only when someone books it (see save_recommendation()); made-up
+    fallback ones are flagged and can't be booked. Ones without a name,
+    location or price are dropped.
+
+    Args:
+        recommendations (list): Hotels from get_hotel_recommendations()
+
+    Returns:
+        list: The recommendations, each with ``id`` None and a ``fallback`` flag
+    """
+    return [
+        dict(rec, id=None, fallback=bool(rec.get('fallback')))
+        for rec in recommendations or [] if _hotel_fields(rec)
+    ]
+
+
+def save_recommendation(rec):
+    """
+    Store a recommended hotel that is being booked
+
+    The hotel is matched to a stored one with the same name and location, or
+    added as a new one. Fallback recommendations are never stored.
+
+    Args:
+        rec (dict): A recommendation from prepare_recommendations()
+
+    Returns:
+        Hotel: The stored hotel, or None if it can't be booked
+    """
+    fields = _hotel_fields(rec)
+    if fields is None or rec.get('fallback'):
+        return None
+    name, location, price = fields
+
+    hotel = Hotel.query.filter(
+        func.lower(Hotel.name) == name.lower(),
+        Hotel.location_key == normalize_location(location)
+    ).first()
+    if hotel is not None:
+        return hotel
+
+    hotel = Hotel(
+        name=name,
+        location=location,
+        price_per_night=price,
+        rating=_number(rec.get('rating'), 0),
+        description=rec.get('description')
+    )
+    db.session.add(hotel)
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error saving recommended hotel: {e}")
+        return None
+    return hotel
+
+
+def _merge(local, recommendations, limit):
+    names = {hotel['name'].lower() for hotel in local}
+    extra = [hotel for hotel in recommendations or [] if str(hotel.get('name', '')).lower() not in names]
+    return (local + extra)[:limit]
+
+
+def find_hotels(destination, budget, num_results=5):
+    """
+    Hotels for the /hotels page: our own data first, then ChatGPT if that is too thin
+
+    Returns:
+        list: Hotels in the same format as get_hotel_recommendations(), or None
+    """
+    from utils.openai_helper import get_hotel_recommendations
+
+    local = search_hotels(destination, budget, num_results)
+    if len(local) >= min(HOTEL_SEARCH_MIN_RESULTS, num_results):
+        return local
+    recommendations = prepare_recommendations(get_hotel_recommendations(destination, budget, num_results))
+    return _merge(local, recommendations, num_results) or None
+
+
+async def async_find_hotels(destination, budget, num_results=5):
+    """Async version of find_hotels(); the database search runs on a thread"""
+    from utils.openai_helper import async_get_hotel_recommendations
+
+    def search():
+        try:
+            return search_hotels(destination, budget, num_results)
+        finally:
+            db.session.close()
+
+    local = await asyncio.to_thread(search)
+    if len(local) >= min(HOTEL_SEARCH_MIN_RESULTS, num_results):
+        return local
+    recommendations = prepare_recommendations(await async_get_hotel_recommendations(destination, budget, num_results))
+    return _merge(local, recommendations, num_results) or None
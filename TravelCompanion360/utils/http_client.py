@@ -0,0 +1,157 @@
+import os
+import random
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+from utils.metrics import observe_upstream
+
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.2"))
+# The async client multiplexes many in-flight calls, so it gets a larger pool
+ASYNC_HTTP_POOL_SIZE = int(os.environ.get("ASYNC_HTTP_POOL_SIZE", "200"))
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_session():
+    """
+    Return the shared keep-alive session used for outbound HTTP calls
+
+    The session is created on first use so importing this module is cheap,
+    and its connection pool is sized by HTTP_POOL_SIZE.
+    """
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _service(url):
+    # Metrics are labelled by upstream host, e.g. maps.googleapis.com
+    return urlsplit(url).hostname or 'unknown'
+
+
+def _outcome(status_code):
+    return f"{status_code // 100}xx"
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt"""
+    return random.uniform(0, HTTP_BACKOFF_BASE * (2 ** attempt))
+
+
+def get(url, params=None, timeout=None, max_retries=None):
+    """
+    Send a GET request through the pooled session with timeouts and retries
+
+    Connection errors, timeouts and retryable statuses are retried up to
+    ``max_retries`` times with jittered backoff; the last response or
+    exception is returned or raised.
+
+    Args:
+        url (str): The URL to fetch
+        params (dict, optional): Query string parameters
+        timeout (tuple, optional): (connect, read) timeouts in seconds
+        max_retries (int, optional): Overrides HTTP_MAX_RETRIES
+
+    Returns:
+        requests.Response: The final response
+    """
+    import requests
+
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    session = get_session()
+    started = time.perf_counter()
+    outcome = 'error'
+
+    try:
+        for attempt in range(max_retries + 1):
+            try:
+                response = session.get(url, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == max_retries:
+                    raise
+                logging.warning(f"HTTP GET failed ({e.__class__.__name__}), retrying: {url}")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                    outcome = _outcome(response.status_code)
+                    return response
+                logging.warning(f"HTTP GET returned {response.status_code}, retrying: {url}")
+            time.sleep(_backoff(attempt))
+    finally:
+        observe_upstream(_service(url), outcome, time.perf_counter() - started)
+
+
+def get_async_client():
+    """
+    Return the pooled httpx.AsyncClient for the running event loop
+
+    httpx connection pools are tied to the loop they were created on, so one
+    client is kept per loop (normally one per ASGI worker process).
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_HTTP_POOL_SIZE, max_keepalive_connections=ASYNC_HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def async_get(url, params=None, timeout=None, max_retries=None):
+    """
+    Async counterpart of get(): same timeouts, retryable statuses and backoff
+
+    Returns:
+        httpx.Response: The final response
+    """
+    import httpx
+
+    timeout = httpx.Timeout(timeout[1], connect=timeout[0]) if timeout else httpx.USE_CLIENT_DEFAULT
+    max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    client = get_async_client()
+    started = time.perf_counter()
+    outcome = 'error'
+
+    try:
+        for attempt in range(max_retries + 1):
+            try:
+                response = await client.get(url, params=params, timeout=timeout)
+            except httpx.TransportError as e:
+                if attempt == max_retries:
+                    raise
+                logging.warning(f"HTTP GET failed ({e.__class__.__name__}), retrying: {url}")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                    outcome = _outcome(response.status_code)
+                    return response
+                logging.warning(f"HTTP GET returned {response.status_code}, retrying: {url}")
+            await asyncio.sleep(_backoff(attempt))
+    finally:
+        observe_upstream(_service(url), outcome, time.perf_counter() - started)
@@ -0,0 +1,452 @@
+import os
+import logging
+from datetime import timedelta
+
+from collections import defaultdict
+
+from sqlalchemy import func, insert, update
+
+from db import db, dialect_insert
+from models import Hotel, RoomAvailability, RoomInventory
+from utils.cache import LRUCache
+from utils.occupancy import rebuild_occupancy, stay_nights
+
+INVENTORY_CACHE_SIZE = int(os.environ.get("INVENTORY_CACHE_SIZE", "256"))
+
+_cache = LRUCache(maxsize=INVENTORY_CACHE_SIZE)
+
+
+class RoomConflict(Exception):
+    """A room picked for a stay was booked by someone else before it could be claimed"""
+
+
+def _window_mask(nights):
+    return (1 << nights) - 1
+
+
+class HotelInventory:
+    """
+    In-memory occupancy of a hotel as one integer bitmap per room.
+
+    Bit ``i`` of a room's bitmap is set when the night ``epoch + i days`` is booked,
+    so every range question becomes a shift and a mask instead of a table scan.
+    Rooms without a bitmap are free on every night.
+    """
+
+    def __init__(self, hotel_id, total_rooms, epoch, rooms=None):
+        self.hotel_id = hotel_id
+        self.total_rooms = total_rooms
+        self.epoch = epoch
+        self.rooms = rooms or {}
+        self.dirty = set()
+
+    @classmethod
+    def from_nights(cls, hotel_id, total_rooms, nights, epoch=None):
+        """
+        Build an inventory from booked (room_number, date) pairs
+
+        Args:
+            hotel_id (int): Hotel the nights belong to
+            total_rooms (int): Number of rooms in the hotel
+            nights (iterable): (room_number, date) tuples for booked nights
+            epoch (date, optional): First night represented by bit 0
+
+        Returns:
+            HotelInventory: The populated inventory
+        """
+        nights = list(nights)
+        if epoch is None:
+            epoch = min((night for _, night in nights), default=None)
+        inventory = cls(hotel_id, total_rooms, epoch)
+        for room_number, night in nights:
+            if room_number is not None:
+                inventory._set(room_number, night, night + timedelta(days=1), True)
+        inventory.dirty.clear()
+        return inventory
+
+    def _offset(self, day):
+        """Return the bit index of ``day``, rebasing the epoch if the day precedes it"""
+        if self.epoch is None:
+            self.epoch = day
+        elif day < self.epoch:
+            shift = (self.epoch - day).days
+            self.rooms = {room: bits << shift for room, bits in self.rooms.items()}
+            self.epoch = day
+        return (day - self.epoch).days
+
+    def _window(self, bits, check_in, check_out):
+        """Extract the stay's nights from a bitmap without modifying the inventory"""
+        if self.epoch is None:
+            return 0
+        mask = _window_mask((check_out - check_in).days)
+        offset = (check_in - self.epoch).days
+        if offset >= 0:
+            return (bits >> offset) & mask
+        return (bits << -offset) & mask
+
+    def _set(self, room_number, check_in, check_out, booked):
+        nights = (check_out - check_in).days
+        mask = _window_mask(nights) << self._offset(check_in)
+        bits = self.rooms.get(room_number, 0)
+        self.rooms[room_number] = (bits | mask) if booked else (bits & ~mask)
+        self.dirty.add(room_number)
+
+    def room_window(self, room_number, start, end):
+        """Return the room's nights in [start, end) as a bitmap, bit 0 being ``start``"""
+        return self._window(self.rooms.get(room_number, 0), start, end)
+
+    def is_room_free(self, room_number, check_in, check_out):
+        """Return True if the room has no booked night in [check_in, check_out)"""
+        return self._window(self.rooms.get(room_number, 0), check_in, check_out) == 0
+
+    def find_free_room(self, check_in, check_out, exclude=()):
+        """
+        Find the lowest-numbered room that is free for the whole stay
+
+        Args:
+            check_in (date): First night of the stay
+            check_out (date): Departure day (not a booked night)
+            exclude (iterable, optional): Room numbers to skip
+
+        Returns:
+            int: The room number, or None if every room is taken on some night
+        """
+        for room_number in range(1, self.total_rooms + 1):
+            if room_number not in exclude and self.is_room_free(room_number, check_in, check_out):
+                return room_number
+        return None
+
+    def free_rooms_per_night(self, check_in, check_out):
+        """
+        Count free rooms on each night of [check_in, check_out)
+
+        Args:
+            check_in (date): First night of the range
+            check_out (date): Day after the last night of the range
+
+        Returns:
+            list: Number of free rooms for each night, in date order
+        """
+        nights = (check_out - check_in).days
+        if nights <= 0:
+            return []
+        # Bit-sliced counter: counters[i] holds bit i of each night's booked count,
+        # so adding a room's window costs a handful of big-integer operations.
+        counters = []
+        for room in range(1, self.total_rooms + 1):
+            carry = self._window(self.rooms.get(room, 0), check_in, check_out)
+            for i, counter in enumerate(counters):
+                if not carry:
+                    break
+                counters[i] = counter ^ carry
+                carry = counter & carry
+            if carry:
+                counters.append(carry)
+        free = []
+        for night in range(nights):
+            booked = 0
+            for i, counter in enumerate(counters):
+                booked |= ((counter >> night) & 1) << i
+            free.append(self.total_rooms - booked)
+        return free
+
+    def book(self, room_number, check_in, check_out):
+        """Mark the room as booked for every night of [check_in, check_out)"""
+        self._set(room_number, check_in, check_out, True)
+
+    def release(self, room_number, check_in, check_out):
+        """Mark the room as free for every night of [check_in, check_out)"""
+        self._set(room_number, check_in, check_out, False)
+
+
+def _to_row(inventory, room_number, row):
+    """Store a room's bitmap trimmed to its first booked night"""
+    bits = inventory.rooms.get(room_number, 0)
+    lowest = (bits & -bits).bit_length() - 1 if bits else 0
+    bits >>= lowest
+    row.start_date = inventory.epoch + timedelta(days=lowest)
+    row.occupancy = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def rebuild_inventory(hotel):
+    """
+    Rebuild a hotel's bitmaps and nightly counters from its RoomAvailability rows
+
+    Args:
+        hotel (Hotel): The hotel to rebuild
+
+    Returns:
+        HotelInventory: The rebuilt inventory (not yet committed)
+    """
+    logging.info(f"Rebuilding room inventory for hotel {hotel.id}")
+    nights = db.session.query(RoomAvailability.room_number, RoomAvailability.date).filter(
+        RoomAvailability.hotel_id == hotel.id,
+        RoomAvailability.is_available == False
+    ).all()
+    inventory = HotelInventory.from_nights(hotel.id, hotel.total_rooms, nights)
+    inventory.dirty.update(inventory.rooms)
+    RoomInventory.query.filter_by(hotel_id=hotel.id).delete()
+    save_inventory(hotel, inventory)
+    rebuild_occupancy(hotel.id)
+    return inventory
+
+
+def ensure_inventory(hotel):
+    """Build the hotel's bitmaps and nightly counters if they do not exist yet"""
+    if hotel.inventory_version is None:
+        rebuild_inventory(hotel)
+
+
+def load_inventory(hotel):
+    """
+    Load a hotel's bitmaps from the database, building them on first use
+
+    Args:
+        hotel (Hotel): The hotel to load
+
+    Returns:
+        HotelInventory: A fresh inventory that is safe to modify
+    """
+    if hotel.inventory_version is None:
+        return rebuild_inventory(hotel)
+
+    rows = db.session.query(
+        RoomInventory.room_number,
+        RoomInventory.start_date,
+        RoomInventory.occupancy
+    ).filter(RoomInventory.hotel_id == hotel.id).all()
+    epoch = min((row.start_date for row in rows), default=None)
+    inventory = HotelInventory(hotel.id, hotel.total_rooms, epoch)
+    for row in rows:
+        shift = (row.start_date - epoch).days
+        inventory.rooms[row.room_number] = int.from_bytes(row.occupancy, 'little') << shift
+    return inventory
+
+
+def save_inventory(hotel, inventory):
+    """
+    Write the modified rooms of an inventory back to the session
+
+    The hotel's inventory version is bumped so cached copies in other workers
+    are discarded the next time they see the hotel row.
+    """
+    if inventory.dirty:
+        rows = {
+            row.room_number: row
+            for row in RoomInventory.query.filter(
+                RoomInventory.hotel_id == hotel.id,
+                RoomInventory.room_number.in_(inventory.dirty)
+            )
+        }
+        for room_number in inventory.dirty:
+            row = rows.get(room_number)
+            if row is None:
+                row = RoomInventory(hotel_id=hotel.id, room_number=room_number)
+                db.session.add(row)
+            _to_row(inventory, room_number, row)
+        inventory.dirty.clear()
+    bump_inventory_version(hotel)
+
+
+def bump_inventory_version(hotel):
+    """
+    Increment the hotel's inventory version in SQL and drop the cached copy
+
+    The increment happens in the database, so concurrent writers without a
+    hotel lock each get a distinct version instead of both writing N+1.
+    """
+    db.session.execute(
+        update(Hotel).where(Hotel.id == hotel.id).values(
+            inventory_version=func.coalesce(Hotel.inventory_version, 0) + 1
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.refresh(hotel, ['inventory_version'])
+    invalidate_inventory(hotel.id)
+
+
+def get_inventory(hotel):
+    """
+    Return a cached, read-only inventory for the hotel
+
+    The cached copy is reused while the hotel's inventory version is unchanged.
+    Use load_inventory() for an inventory that will be modified.
+    """
+    entry = _cache.get(hotel.id)
+    if entry and entry[0] == hotel.inventory_version and entry[1].total_rooms == hotel.total_rooms:
+        return entry[1]
+
+    inventory = load_inventory(hotel)
+    _cache.set(hotel.id, (hotel.inventory_version, inventory))
+    return inventory
+
+
+def availability_grid(hotel, start, days):
+    """
+    Return a hotel's rooms x days occupancy matrix
+
+    Read from the cached bitmaps, so no RoomAvailability rows are loaded.
+
+    Args:
+        hotel (Hotel): The hotel to show
+        start (date): First night of the window
+        days (int): Number of nights in the window
+
+    Returns:
+        list: One bitmap per room (index 0 is room 1); bit i is set when
+        night ``start + i days`` is booked
+    """
+    inventory = get_inventory(hotel)
+    end = start + timedelta(days=days)
+    return [inventory.room_window(room, start, end) for room in range(1, hotel.total_rooms + 1)]
+
+
+def invalidate_inventory(hotel_id):
+    """Drop a hotel's cached inventory"""
+    _cache.pop(hotel_id)
+
+
+def assign_room(hotel, booking_id, check_in, check_out, exclude=()):
+    """
+    Assign the first room free for the whole stay and write its night rows
+
+    The stay window's rows are fetched with one query and the room is picked
+    in memory. The nights are then claimed with one INSERT ... ON CONFLICT
+    that takes over free rows and adds missing ones, so the cost does not
+    depend on the number of rooms or nights.
+
+    Args:
+        hotel (Hotel): The hotel being booked
+        booking_id (int): Booking the nights belong to
+        check_in (date): First night of the stay
+        check_out (date): Departure day (not a booked night)
+        exclude (iterable, optional): Room numbers not to assign
+
+    Returns:
+        int: The assigned room number, or None if no room is free
+
+    Raises:
+        RoomConflict: A night of the picked room was booked concurrently
+    """
+    window = db.session.query(
+        RoomAvailability.room_number,
+        RoomAvailability.date,
+        RoomAvailability.is_available
+    ).filter(
+        RoomAvailability.hotel_id == hotel.id,
+        RoomAvailability.date >= check_in,
+        RoomAvailability.date < check_out
+    ).all()
+
+    inventory = HotelInventory.from_nights(
+        hotel.id, hotel.total_rooms,
+        [(room, night) for room, night, available in window if not available],
+        epoch=check_in
+    )
+    room_number = inventory.find_free_room(check_in, check_out, exclude=exclude)
+    if room_number is None:
+        return None
+
+    rows = [
+        {
+            'hotel_id': hotel.id,
+            'date': night,
+            'is_available': False,
+            'booking_id': booking_id,
+            'room_number': room_number
+        }
+        for night in stay_nights(check_in, check_out)
+    ]
+
+    stmt = dialect_insert(RoomAvailability)
+    if stmt is None:
+        _claim_nights(hotel, room_number, booking_id, rows, {night for room, night, _ in window if room == room_number})
+        return room_number
+
+    stmt = stmt.values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RoomAvailability.hotel_id, RoomAvailability.date, RoomAvailability.room_number],
+        set_={'is_available': False, 'booking_id': stmt.excluded.booking_id},
+        # Never take over a night another booking holds
+        where=RoomAvailability.is_available == True
+    )
+    if db.session.execute(stmt).rowcount != len(rows):
+        raise RoomConflict(f"Room {room_number} at hotel {hotel.id} was booked concurrently")
+    return room_number
+
+
+def _claim_nights(hotel, room_number, booking_id, rows, existing):
+    # Databases without ON CONFLICT: update the free rows, insert the rest
+    if existing:
+        RoomAvailability.query.filter(
+            RoomAvailability.hotel_id == hotel.id,
+            RoomAvailability.room_number == room_number,
+            RoomAvailability.date.in_(existing)
+        ).update({'is_available': False, 'booking_id': booking_id}, synchronize_session=False)
+    new_rows = [row for row in rows if row['date'] not in existing]
+    if new_rows:
+        db.session.execute(insert(RoomAvailability), new_rows)
+
+
+def _update_rooms(hotel, changes):
+    """
+    Apply bookings or releases to just the affected rooms' bitmap rows
+
+    Only the RoomInventory rows of the rooms in ``changes`` are read (locked
+    on databases that support it) and written, so the cost does not grow with
+    the size of the hotel.
+
+    Args:
+        hotel (Hotel): The hotel whose rooms change
+        changes (dict): room_number -> list of (check_in, check_out, booked)
+    """
+    if hotel.inventory_version is None:
+        # Never built: the room-night rows already include this change
+        rebuild_inventory(hotel)
+        return
+
+    query = RoomInventory.query.filter(
+        RoomInventory.hotel_id == hotel.id,
+        RoomInventory.room_number.in_(changes)
+    )
+    if db.session.get_bind().dialect.name != 'sqlite':
+        # SQLite already holds the write lock from the room-night rows
+        query = query.with_for_update()
+    rows = {row.room_number: row for row in query}
+
+    starts = [row.start_date for row in rows.values()] + [start for spans in changes.values() for start, _, _ in spans]
+    inventory = HotelInventory(hotel.id, hotel.total_rooms, min(starts))
+    for room_number, row in rows.items():
+        shift = (row.start_date - inventory.epoch).days
+        inventory.rooms[room_number] = int.from_bytes(row.occupancy, 'little') << shift
+    for room_number, spans in changes.items():
+        for check_in, check_out, booked in spans:
+            inventory._set(room_number, check_in, check_out, booked)
+
+    for room_number in changes:
+        row = rows.get(room_number)
+        if row is None:
+            row = RoomInventory(hotel_id=hotel.id, room_number=room_number)
+            db.session.add(row)
+        _to_row(inventory, room_number, row)
+    bump_inventory_version(hotel)
+
+
+def reserve_room(hotel, room_number, check_in, check_out):
+    """Mark a room as booked in the hotel's persisted inventory"""
+    _update_rooms(hotel, {room_number: [(check_in, check_out, True)]})
+
+
+def release_nights(hotel, nights):
+    """
+    Mark booked nights as free again in the hotel's persisted inventory
+
+    Args:
+        hotel (Hotel): The hotel the nights belong to
+        nights (iterable): (room_number, date) tuples to release
+    """
+    changes = defaultdict(list)
+    for room_number, night in nights:
+        if room_number is not None:
+            changes[room_number].append((night, night + timedelta(days=1), False))
+    if changes:
+        _update_rooms(hotel, changes)
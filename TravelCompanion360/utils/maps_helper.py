@@ -1,8 +1,18 @@
 import os
-import requests
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+from utils import geocode_cache, http_client
+from utils.singleflight import async_single_flight, shared_flight, single_flight
 
 GOOGLE_MAPS_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY")
+GOOGLE_MAPS_API_URL = os.environ.get("GOOGLE_MAPS_API_URL", "https://maps.googleapis.com/maps/api")
+GEOCODE_URL = f"{GOOGLE_MAPS_API_URL}/geocode/json"
+NEARBY_URL = f"{GOOGLE_MAPS_API_URL}/place/nearbysearch/json"
+GEOCODE_BATCH_WORKERS = int(os.environ.get("GEOCODE_BATCH_WORKERS", "8"))
 
 def get_coordinates(location):
     """
@@ -14,34 +24,104 @@ def get_coordinates(location):
     Returns:
         dict: Dictionary with lat and lng keys, or None if unsuccessful
     """
+    cached = geocode_cache.lookup(location)
+    if cached is not geocode_cache.MISS:
+        return cached
+    
+    return _resolve_coordinates(location)
+
+@single_flight(lambda location: geocode_cache.normalize_location(location))
+def _resolve_coordinates(location):
+    """Fetch an uncached location once, however many requests ask for it at the same time"""
+    def recheck():
+        cached = geocode_cache.lookup(location)
+        return cached is not geocode_cache.MISS, cached
+    
+    key = f"geocode:{geocode_cache.normalize_location(location)}"
+    return shared_flight(key, lambda: _fetch_coordinates(location), recheck)
+
+def _parse_geocode(data):
+    """
+    Read coordinates out of a Geocoding API response
+    
+    Returns:
+        tuple: (coords or None, whether the answer may be cached)
+    """
+    if data["status"] == "OK" and len(data["results"]) > 0:
+        result = data["results"][0]["geometry"]["location"]
+        return {
+            "lat": result["lat"],
+            "lng": result["lng"]
+        }, True
+    elif data["status"] == "ZERO_RESULTS":
+        # Remember unknown places briefly; other statuses are transient
+        return None, True
+    else:
+        logging.error(f"Geocoding error: {data['status']}")
+        return None, False
+
+def _fetch_coordinates(location):
+    """Call the Geocoding API for a location that is not cached and cache the result"""
     if not GOOGLE_MAPS_API_KEY:
         logging.error("Google Maps API key not found")
         return None
         
     try:
-        url = "https://maps.googleapis.com/maps/api/geocode/json"
         params = {
             "address": location,
             "key": GOOGLE_MAPS_API_KEY
         }
         
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if data["status"] == "OK" and len(data["results"]) > 0:
-            location = data["results"][0]["geometry"]["location"]
-            return {
-                "lat": location["lat"],
-                "lng": location["lng"]
-            }
-        else:
-            logging.error(f"Geocoding error: {data['status']}")
-            return None
+        response = http_client.get(GEOCODE_URL, params=params)
+        coords, cacheable = _parse_geocode(response.json())
+        if cacheable:
+            geocode_cache.store(location, coords)
+        return coords
             
     except Exception as e:
         logging.error(f"Error getting coordinates: {e}")
         return None
 
+def get_coordinates_batch(locations, max_workers=None):
+    """
+    Geocode many locations at once
+    
+    Locations are deduplicated by their normalized form, cached results are
+    returned immediately and the rest are fetched concurrently on a bounded
+    thread pool.
+    
+    Args:
+        locations (list): Locations to geocode
+        max_workers (int, optional): Concurrent lookups, defaults to GEOCODE_BATCH_WORKERS
+        
+    Returns:
+        dict: Maps each input location to a dict with lat and lng keys, or None
+    """
+    unique = {}
+    for location in locations:
+        unique.setdefault(geocode_cache.normalize_location(location), location)
+    
+    results = geocode_cache.lookup_many(unique.values())
+    pending = {key: location for key, location in unique.items() if key not in results}
+    
+    if pending:
+        # Worker threads need their own app context for the database cache tier
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        def resolve(location):
+            if app is None:
+                return _resolve_coordinates(location)
+            with app.app_context():
+                return _resolve_coordinates(location)
+        
+        workers = min(max_workers or GEOCODE_BATCH_WORKERS, len(pending))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for key, coords in zip(pending, pool.map(resolve, pending.values())):
+                results[key] = coords
+    
+    return {location: results[geocode_cache.normalize_location(location)] for location in locations}
+
+@single_flight(lambda lat, lng, place_type, radius=5000: (round(float(lat), 5), round(float(lng), 5), place_type, radius))
 def get_nearby_places(lat, lng, place_type, radius=5000):
     """
     Get nearby places of a specific type using Google Places API
@@ -60,23 +140,90 @@ def get_nearby_places(lat, lng, place_type, radius=5000):
         return None
         
     try:
-        url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+        response = http_client.get(NEARBY_URL, params=_nearby_params(lat, lng, place_type, radius))
+        return _parse_nearby(response.json())
+            
+    except Exception as e:
+        logging.error(f"Error getting nearby places: {e}")
+        return None
+
+def _nearby_params(lat, lng, place_type, radius):
+    return {
+        "location": f"{lat},{lng}",
+        "radius": radius,
+        "type": place_type,
+        "key": GOOGLE_MAPS_API_KEY
+    }
+
+def _parse_nearby(data):
+    if data["status"] == "OK":
+        return data["results"]
+    else:
+        logging.error(f"Places API error: {data['status']}")
+        return None
+
+# Async variants for the ASGI serving mode (see asgi.py). They share the
+# caches above but never block the event loop on the network or database.
+
+async def async_get_coordinates(location):
+    """Async version of get_coordinates()"""
+    cached = await asyncio.to_thread(geocode_cache.lookup, location)
+    if cached is not geocode_cache.MISS:
+        return cached
+    
+    return await _async_fetch_coordinates(location)
+
+@async_single_flight(lambda location: geocode_cache.normalize_location(location))
+async def _async_fetch_coordinates(location):
+    if not GOOGLE_MAPS_API_KEY:
+        logging.error("Google Maps API key not found")
+        return None
+    
+    try:
         params = {
-            "location": f"{lat},{lng}",
-            "radius": radius,
-            "type": place_type,
+            "address": location,
             "key": GOOGLE_MAPS_API_KEY
         }
         
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if data["status"] == "OK":
-            return data["results"]
-        else:
-            logging.error(f"Places API error: {data['status']}")
-            return None
-            
+        response = await http_client.async_get(GEOCODE_URL, params=params)
+        coords, cacheable = _parse_geocode(response.json())
+        if cacheable:
+            await asyncio.to_thread(geocode_cache.store, location, coords)
+        return coords
+    
+    except Exception as e:
+        logging.error(f"Error getting coordinates: {e}")
+        return None
+
+async def async_get_coordinates_batch(locations, max_concurrency=None):
+    """Async version of get_coordinates_batch(), bounded by a semaphore instead of a thread pool"""
+    unique = {}
+    for location in locations:
+        unique.setdefault(geocode_cache.normalize_location(location), location)
+    
+    results = await asyncio.to_thread(geocode_cache.lookup_many, unique.values())
+    pending = {key: location for key, location in unique.items() if key not in results}
+    semaphore = asyncio.Semaphore(max_concurrency or GEOCODE_BATCH_WORKERS)
+    
+    async def resolve(location):
+        async with semaphore:
+            return await _async_fetch_coordinates(location)
+    
+    resolved = await asyncio.gather(*(resolve(location) for location in pending.values()))
+    results.update(zip(pending, resolved))
+    return {location: results[geocode_cache.normalize_location(location)] for location in locations}
+
+@async_single_flight(lambda lat, lng, place_type, radius=5000: (round(float(lat), 5), round(float(lng), 5), place_type, radius))
+async def async_get_nearby_places(lat, lng, place_type, radius=5000):
+    """Async version of get_nearby_places()"""
+    if not GOOGLE_MAPS_API_KEY:
+        logging.error("Google Maps API key not found")
+        return None
+    
+    try:
+        response = await http_client.async_get(NEARBY_URL, params=_nearby_params(lat, lng, place_type, radius))
+        return _parse_nearby(response.json())
+    
     except Exception as e:
         logging.error(f"Error getting nearby places: {e}")
         return None
@@ -0,0 +1,258 @@
+import os
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+
+from flask import request
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UPSTREAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# [started, sql statements, sql seconds] for the request being handled
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=(), lock=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = lock or threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._inc(labels, amount)
+
+    def _inc(self, labels, amount=1):
+        # Caller holds self._lock
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with labels, rendered in the Prometheus text format
+
+    An observation is a bisect and two additions under a lock; buckets are
+    only made cumulative when rendered. Metrics updated together can share
+    a lock so that costs one acquisition.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, lock=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [count per bucket (+Inf last), sum]
+        self._lock = lock or threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            self._observe(value, labels)
+
+    def _observe(self, value, labels):
+        # Caller holds self._lock
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {repr(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+# The per-request metrics are updated together under one lock
+_request_lock = threading.Lock()
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by Flask endpoint.', ('endpoint', 'method'),
+    lock=_request_lock
+)
+requests_total = Counter(
+    'http_requests_total', 'Responses sent, by Flask endpoint and status code.', ('endpoint', 'method', 'status'),
+    lock=_request_lock
+)
+request_queries = Histogram(
+    'db_queries_per_request', 'SQL statements executed while handling a request.', ('endpoint',), QUERY_COUNT_BUCKETS,
+    lock=_request_lock
+)
+request_query_seconds = Histogram(
+    'db_query_seconds_per_request', 'Time spent in SQL statements while handling a request.', ('endpoint',),
+    lock=_request_lock
+)
+upstream_duration = Histogram(
+    'upstream_request_duration_seconds', 'Calls to OpenAI and Google Maps, including retries.',
+    ('service', 'outcome'), UPSTREAM_BUCKETS
+)
+upstream_fallbacks = Counter(
+    'upstream_fallbacks_total', 'Answers served by a local fallback instead of the upstream.', ('service', 'kind')
+)
+
+
+def observe_upstream(service, outcome, seconds):
+    """Record one upstream call; outcome is e.g. 'ok', 'error' or an HTTP status class like '5xx'"""
+    if METRICS_ENABLED:
+        upstream_duration.observe(seconds, service, outcome)
+
+
+def count_fallback(service, kind):
+    if METRICS_ENABLED:
+        upstream_fallbacks.inc(service, kind)
+
+
+def collector(fn):
+    """Register a function returning extra metric lines, called on every scrape"""
+    _collectors.append(fn)
+    return fn
+
+
+def _before_request():
+    _request_stats.set([time.perf_counter(), 0, 0.0])
+
+
+def _after_request(response):
+    stats = _request_stats.get()
+    if stats is not None:
+        elapsed = time.perf_counter() - stats[0]
+        _request_stats.set(None)
+        current = request._get_current_object()
+        endpoint = current.endpoint or 'unmatched'
+        labels = (endpoint, current.method)
+        with _request_lock:
+            request_duration._observe(elapsed, labels)
+            requests_total._inc(labels + (response.status_code,))
+            request_queries._observe(stats[1], (endpoint,))
+            request_query_seconds._observe(stats[2], (endpoint,))
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats.get() is not None:
+        conn.info['metrics_query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    started = conn.info.pop('metrics_query_start', None)
+    if stats is not None and started is not None:
+        stats[1] += 1
+        stats[2] += time.perf_counter() - started
+
+
+_listening = False
+
+
+def init_app(app):
+    """Time every request and count its SQL statements"""
+    global _listening
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if not _listening:
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+@collector
+def _cache_metrics():
+    from utils import answer_cache, geocode_cache, recommendation_cache
+
+    lines = [
+        '# HELP cache_events_total Cache lookups by outcome (hits, misses, ...).',
+        '# TYPE cache_events_total counter'
+    ]
+    sizes = []
+    for name, stats in (('geocode', geocode_cache.get_cache_stats()),
+                        ('recommendations', recommendation_cache.get_cache_stats()),
+                        ('answers', answer_cache.get_cache_stats())):
+        for key, value in sorted(stats.items()):
+            if key in ('size', 'memory_size'):
+                sizes.append(f'cache_entries{{cache="{name}"}} {value}')
+            elif key not in ('maxsize', 'threshold', 'hit_rate'):
+                lines.append(f'cache_events_total{{cache="{name}",event="{key}"}} {value}')
+    lines += ['# HELP cache_entries Entries held in the in-process cache.', '# TYPE cache_entries gauge'] + sizes
+    return lines
+
+
+@collector
+def _breaker_metrics():
+    from utils.circuit_breaker import OPEN, get_breakers
+
+    breakers = get_breakers()
+    lines = [
+        '# HELP circuit_breaker_calls_total Calls through a circuit breaker by result.',
+        '# TYPE circuit_breaker_calls_total counter'
+    ]
+    for breaker in breakers:
+        for result in ('successes', 'failures', 'rejected'):
+            lines.append(f'circuit_breaker_calls_total{{breaker="{breaker["name"]}",result="{result}"}} {breaker[result]}')
+    lines += ['# HELP circuit_breaker_open Whether the circuit is open (1) or not (0).', '# TYPE circuit_breaker_open gauge']
+    lines += [f'circuit_breaker_open{{breaker="{breaker["name"]}"}} {int(breaker["state"] == OPEN)}' for breaker in breakers]
+    return lines
+
+
+@collector
+def _booking_metrics():
+    from utils.booking import get_booking_stats
+
+    lines = ['# HELP booking_events_total Booking attempts and their results.', '# TYPE booking_events_total counter']
+    lines += [f'booking_events_total{{event="{event}"}} {count}' for event, count in sorted(get_booking_stats().items())]
+    return lines
+
+
+def render_metrics():
+    """Return every metric of this process in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        lines.extend(fn())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,396 @@
+import os
+import re
+import json
+import logging
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import (Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, MetaData,
+                        String, Table, Text, UniqueConstraint, func, inspect, select, text)
+
+from db import db
+from models import Booking, Hotel, HotelOccupancy, RoomAvailability, RoomInventory
+
+# Apply pending migrations in create_app(); otherwise run `flask db upgrade` before starting the app
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "0") == "1"
+
+# Kept out of db.metadata so create_all() never creates it behind the migrations' back
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow)
+)
+
+# (version, name, function(conn)) in the order they are applied. Migrations are
+# forward-only and never edited once released: change the schema by adding one.
+# Each must be safe on a database that already has its change, since databases
+# from before migrations existed already have part of the schema.
+MIGRATIONS = []
+
+# The tables as migrations create them, frozen here so later model changes
+# never alter what an old migration does. Changes go in a new migration.
+_schema = MetaData()
+
+# The schema create_all() built from the models before migrations existed
+BASELINE_TABLES = (
+    Table(
+        'user', _schema,
+        Column('id', Integer, primary_key=True),
+        Column('username', String(64), nullable=False, unique=True),
+        Column('email', String(120), nullable=False, unique=True),
+        Column('password_hash', String(256), nullable=False),
+        Column('created_at', DateTime)
+    ),
+    Table(
+        'hotel', _schema,
+        Column('id', Integer, primary_key=True),
+        Column('name', String(100), nullable=False),
+        Column('location', String(100), nullable=False),
+        Column('price_per_night', Float, nullable=False, index=True),
+        Column('rating', Float, index=True),
+        Column('description', Text),
+        Column('total_rooms', Integer),
+        Column('available_rooms', Integer),
+        Column('last_updated', DateTime),
+        Column('inventory_version', Integer),
+        Column('location_key', String(255), index=True)
+    ),
+    Table(
+        'car_rental', _schema,
+        Column('id', Integer, primary_key=True),
+        Column('location', String(100), nullable=False),
+        Column('car_type', String(50), nullable=False),
+        Column('pickup_date', Date, nullable=False),
+        Column('return_date', Date, nullable=False)
+    ),
+    Table(
+        'booking', _schema,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+        Column('hotel_id', Integer, ForeignKey('hotel.id')),
+        Column('car_rental_id', Integer, ForeignKey('car_rental.id')),
+        Column('booking_type', String(20), nullable=False),
+        Column('booking_date', DateTime),
+        Column('check_in_date', Date),
+        Column('check_out_date', Date),
+        Column('status', String(20)),
+        Index('ix_booking_user_date', 'user_id', 'booking_date', 'id')
+    ),
+    Table(
+        'room_availability', _schema,
+        Column('id', Integer, primary_key=True),
+        Column('hotel_id', Integer, ForeignKey('hotel.id'), nullable=False),
+        Column('date', Date, nullable=False),
+        Column('is_available', Boolean),
+        Column('booking_id', Integer, ForeignKey('booking.id')),
+        Column('room_number', Integer),
+        UniqueConstraint('hotel_id', 'date', 'room_number', name='unique_room_date')
+    ),
+    Table(
+        'room_inventory', _schema,
+        Column('id', Integer, primary_key=True),
+        Column('hotel_id', Integer, ForeignKey('hotel.id'), nullable=False),
+        Column('room_number', Integer, nullable=False),
+        Column('start_date', Date, nullable=False),
+        Column('occupancy', LargeBinary, nullable=False),
+        UniqueConstraint('hotel_id', 'room_number', name='unique_hotel_room_inventory')
+    ),
+    Table(
+        'hotel_occupancy', _schema,
+        Column('hotel_id', Integer, ForeignKey('hotel.id'), primary_key=True),
+        Column('date', Date, primary_key=True),
+        Column('booked_rooms', Integer, nullable=False)
+    ),
+    Table(
+        'geocode_cache', _schema,
+        Column('location_key', String(255), primary_key=True),
+        Column('lat', Float),
+        Column('lng', Float),
+        Column('fetched_at', DateTime, nullable=False)
+    ),
+    Table(
+        'upstream_lock', _schema,
+        Column('lock_key', String(255), primary_key=True),
+        Column('owner', String(64), nullable=False),
+        Column('expires_at', DateTime, nullable=False)
+    ),
+    Table(
+        'chat_conversation', _schema,
+        Column('id', String(32), primary_key=True),
+        Column('messages', Text, nullable=False),
+        Column('summary', Text),
+        Column('updated_at', DateTime)
+    ),
+    Table(
+        'server_session', _schema,
+        Column('sid', String(64), primary_key=True),
+        Column('data', Text, nullable=False),
+        Column('expires_at', DateTime, nullable=False, index=True)
+    ),
+)
+
+room_night_archive = Table(
+    'room_night_archive', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('hotel_id', Integer, ForeignKey('hotel.id'), nullable=False),
+    Column('booking_id', Integer, ForeignKey('booking.id')),
+    Column('room_number', Integer),
+    Column('first_night', Date, nullable=False),
+    Column('nights', Integer, nullable=False),
+    Column('archived_at', DateTime),
+    Index('ix_room_night_archive_hotel_night', 'hotel_id', 'first_night'),
+    Index('ix_room_night_archive_booking', 'booking_id')
+)
+
+
+def migration(version, name):
+    """Register a schema migration; versions must be added in increasing order"""
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} must come after {MIGRATIONS[-1][0]}")
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+def _has_column(conn, table, column):
+    return any(c['name'] == column for c in inspect(conn).get_columns(table))
+
+
+def _add_column(conn, table, column, type_, default=None):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there"""
+    if _has_column(conn, table, column):
+        return
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column} {type_.compile(dialect=conn.dialect)}"
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    conn.execute(text(ddl))
+
+
+def _create_index(conn, name, table, *columns):
+    """CREATE INDEX unless an index of that name already exists on the table"""
+    if any(index['name'] == name for index in inspect(conn).get_indexes(table)):
+        return
+    table = Table(table, MetaData(), autoload_with=conn)
+    Index(name, *(table.c[column] for column in columns)).create(conn)
+
+
+@migration(1, 'baseline')
+def _baseline(conn):
+    # Databases from before migrations existed have some of these tables already
+    for table in BASELINE_TABLES:
+        table.create(conn, checkfirst=True)
+
+
+@migration(2, 'inventory_and_stay_columns')
+def _inventory_and_stay_columns(conn):
+    _add_column(conn, 'hotel', 'total_rooms', Integer(), default=20)
+    _add_column(conn, 'hotel', 'available_rooms', Integer(), default=20)
+    _add_column(conn, 'hotel', 'last_updated', DateTime())
+    _add_column(conn, 'hotel', 'inventory_version', Integer())
+    _add_column(conn, 'hotel', 'location_key', String(255))
+    _add_column(conn, 'booking', 'check_in_date', Date())
+    _add_column(conn, 'booking', 'check_out_date', Date())
+    _add_column(conn, 'booking', 'status', String(20), default="'confirmed'")
+    _add_column(conn, 'chat_conversation', 'summary', Text())
+
+
+@migration(3, 'hot_path_indexes')
+def _hot_path_indexes(conn):
+    _create_index(conn, 'ix_room_availability_hotel_date_available', 'room_availability', 'hotel_id', 'date', 'is_available')
+    _create_index(conn, 'ix_room_availability_booking', 'room_availability', 'booking_id')
+    _create_index(conn, 'ix_booking_user_date', 'booking', 'user_id', 'booking_date', 'id')
+    # Hotel lookups by place go through location_key, the normalized location
+    _create_index(conn, 'ix_hotel_location_key', 'hotel', 'location_key')
+    _create_index(conn, 'ix_hotel_price_per_night', 'hotel', 'price_per_night')
+    _create_index(conn, 'ix_hotel_rating', 'hotel', 'rating')
+    _create_index(conn, 'ix_server_session_expires_at', 'server_session', 'expires_at')
+    # Give the planner row counts for the new indexes
+    conn.execute(text("ANALYZE"))
+
+
+@migration(4, 'availability_date_and_night_archive')
+def _availability_date_and_night_archive(conn):
+    _add_column(conn, 'hotel', 'availability_date', Date())
+    room_night_archive.create(conn, checkfirst=True)
+
+
+@migration(5, 'hotel_search_index')
+def _hotel_search_index(conn):
+    from utils.hotel_search import create_search_index
+    create_search_index(conn)
+
+
+def _lock(conn):
+    # Several workers may start at once; PostgreSQL lets them queue for the
+    # upgrade. On SQLite every migration is idempotent, so a race is harmless.
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("SELECT pg_advisory_lock(hashtext('schema_migrations'))"))
+        conn.commit()
+
+
+def _unlock(conn):
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("SELECT pg_advisory_unlock(hashtext('schema_migrations'))"))
+        conn.commit()
+
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    versions = set(conn.scalars(select(schema_migrations.c.version)))
+    conn.commit()
+    return versions
+
+
+def upgrade(target=None):
+    """
+    Apply every pending migration, oldest first
+
+    Each migration and the row recording it are committed together, so an
+    interrupted upgrade resumes with the migration that failed.
+
+    Args:
+        target (int, optional): Stop after this version instead of the latest
+
+    Returns:
+        list: (version, name) of the migrations applied by this call
+    """
+    applied = []
+    with db.engine.connect() as conn:
+        _lock(conn)
+        try:
+            done = applied_versions(conn)
+            for version, name, fn in MIGRATIONS:
+                if version in done or (target is not None and version > target):
+                    continue
+                try:
+                    with conn.begin():
+                        fn(conn)
+                        conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+                except Exception:
+                    # Another worker may have applied it first
+                    if version in applied_versions(conn):
+                        continue
+                    raise
+                logging.info(f"Applied migration {version} {name}")
+                applied.append((version, name))
+        finally:
+            _unlock(conn)
+    return applied
+
+
+def current_version():
+    """Return the newest applied migration version, or 0 for an unmigrated database"""
+    with db.engine.connect() as conn:
+        return max(applied_versions(conn), default=0)
+
+
+def _hot_queries():
+    """Queries on the booking and search paths, with representative parameters"""
+    from utils.hotel_search import _location_filter, search_index_kind
+
+    today = date.today()
+    stay = (today, today + timedelta(days=3))
+    queries = {
+        'room window': select(RoomAvailability.room_number, RoomAvailability.date, RoomAvailability.is_available).where(
+            RoomAvailability.hotel_id == 1, RoomAvailability.date >= stay[0], RoomAvailability.date < stay[1]
+        ),
+        'booked nights': select(func.count(RoomAvailability.id)).where(
+            RoomAvailability.hotel_id == 1, RoomAvailability.is_available == False
+        ),
+        'booking nights': select(RoomAvailability.id, RoomAvailability.date).where(RoomAvailability.booking_id == 1),
+        'booking history': select(Booking.id).where(Booking.user_id == 1).order_by(
+            Booking.booking_date.desc(), Booking.id.desc()
+        ).limit(21),
+        'occupancy window': select(func.max(HotelOccupancy.booked_rooms)).where(
+            HotelOccupancy.hotel_id == 1, HotelOccupancy.date >= stay[0], HotelOccupancy.date < stay[1]
+        ),
+        'room inventory': select(RoomInventory.room_number, RoomInventory.occupancy).where(RoomInventory.hotel_id == 1),
+    }
+    # A plain LIKE can't use an index; only check search where a substring index exists
+    if search_index_kind():
+        queries['hotel search'] = select(Hotel.id).where(_location_filter('paris'))
+    return queries
+
+
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)(?! VIRTUAL TABLE)")
+
+
+def _full_scans(conn, statement):
+    """Return (plan lines, tables read by a full scan) for a query; the tables are None on other databases"""
+    compiled = statement.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup) if compiled.positional else compiled.params
+
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}", params).all()
+        lines = [row[3] for row in rows]
+        tables = set(db.metadata.tables)
+        return lines, [m.group(1) for m in map(_SQLITE_FULL_SCAN.match, lines) if m and m.group(1) in tables]
+
+    if conn.dialect.name == 'postgresql':
+        with conn.begin():
+            # Small tables are cheaper to scan; only report scans the planner can't avoid
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled.string}", params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, scans, nodes = [], [], [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            lines.append(f"{node['Node Type']} {node.get('Relation Name', '')} {node.get('Index Name', '')}".strip())
+            if node['Node Type'] == 'Seq Scan':
+                scans.append(node['Relation Name'])
+            nodes.extend(node.get('Plans', []))
+        return lines, scans
+
+    return [f"no query plan check for {conn.dialect.name}"], None
+
+
+def check_query_plans():
+    """
+    EXPLAIN the hot queries and report any that read a whole table
+
+    Returns:
+        dict: Query name -> (plan lines, tables read by a full scan, or None
+        if the database's plans can't be checked)
+    """
+    with db.engine.connect() as conn:
+        return {name: _full_scans(conn, statement) for name, statement in _hot_queries().items()}
+
+
+db_cli = AppGroup('db', help='Schema migrations and query plan checks.')
+
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, help='Stop after this migration version.')
+def upgrade_command(target):
+    """Apply pending migrations."""
+    applied = upgrade(target)
+    for version, name in applied:
+        click.echo(f"Applied {version:04d} {name}")
+    click.echo(f"Schema at version {current_version()}" if applied else "Schema is up to date")
+
+
+@db_cli.command('status')
+def status_command():
+    """List migrations and whether they have been applied."""
+    with db.engine.connect() as conn:
+        done = applied_versions(conn)
+    for version, name, _ in MIGRATIONS:
+        click.echo(f"{version:04d} {name:<40} {'applied' if version in done else 'pending'}")
+
+
+@db_cli.command('check-plans')
+def check_plans_command():
+    """Fail if a hot query falls back to a full table scan."""
+    failed = []
+    for name, (lines, scans) in check_query_plans().items():
+        status = 'unsupported' if scans is None else 'FULL SCAN' if scans else 'ok'
+        click.echo(f"{status:>11}  {name}: {'; '.join(lines)}")
+        if scans:
+            failed.append(f"{name} ({', '.join(scans)})")
+    if failed:
+        raise click.ClickException(f"Full table scans in: {', '.join(failed)}")
@@ -0,0 +1,146 @@
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func
+
+from db import db, dialect_insert
+from models import Hotel, HotelOccupancy, RoomAvailability
+
+
+def stay_nights(check_in, check_out):
+    """Return the nights of a stay, excluding the check-out day"""
+    return [check_in + timedelta(days=i) for i in range((check_out - check_in).days)]
+
+
+def max_booked_rooms(hotel_id, check_in, check_out):
+    """
+    Get the highest number of booked rooms on any night of a stay
+
+    Args:
+        hotel_id (int): The hotel to check
+        check_in (date): First night of the stay
+        check_out (date): Departure day (not a booked night)
+
+    Returns:
+        int: The busiest night's booked room count
+    """
+    booked = db.session.query(func.max(HotelOccupancy.booked_rooms)).filter(
+        HotelOccupancy.hotel_id == hotel_id,
+        HotelOccupancy.date >= check_in,
+        HotelOccupancy.date < check_out
+    ).scalar()
+    return booked or 0
+
+
+def adjust_occupancy(hotel_id, nights, delta):
+    """
+    Add ``delta`` booked rooms to each of the given nights
+
+    Positive adjustments are a single multi-row upsert; negative ones are one
+    UPDATE per distinct amount. Nights may repeat, e.g. when several bookings
+    are cancelled together.
+
+    Args:
+        hotel_id (int): The hotel whose counters change
+        nights (iterable): Dates of the booked or released nights
+        delta (int): +1 per night for a booking, -1 per night for a cancellation
+    """
+    per_night = Counter(nights)
+    if not per_night:
+        return
+
+    if delta < 0:
+        by_amount = defaultdict(list)
+        for night, count in per_night.items():
+            by_amount[count * -delta].append(night)
+        for amount, dates in by_amount.items():
+            HotelOccupancy.query.filter(
+                HotelOccupancy.hotel_id == hotel_id,
+                HotelOccupancy.date.in_(dates)
+            ).update(
+                {'booked_rooms': case(
+                    (HotelOccupancy.booked_rooms > amount, HotelOccupancy.booked_rooms - amount),
+                    else_=0
+                )},
+                synchronize_session=False
+            )
+        return
+
+    rows = [
+        {'hotel_id': hotel_id, 'date': night, 'booked_rooms': count * delta}
+        for night, count in per_night.items()
+    ]
+    stmt = dialect_insert(HotelOccupancy)
+    if stmt is None:
+        for row in rows:
+            counter = db.session.get(HotelOccupancy, (hotel_id, row['date']))
+            if counter is None:
+                db.session.add(HotelOccupancy(**row))
+            else:
+                counter.booked_rooms += row['booked_rooms']
+        return
+
+    stmt = stmt.values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[HotelOccupancy.hotel_id, HotelOccupancy.date],
+        set_={'booked_rooms': HotelOccupancy.booked_rooms + stmt.excluded.booked_rooms}
+    )
+    db.session.execute(stmt)
+
+
+def rebuild_occupancy(hotel_id):
+    """Recompute a hotel's nightly counters from its RoomAvailability rows"""
+    HotelOccupancy.query.filter_by(hotel_id=hotel_id).delete()
+    counts = db.session.query(RoomAvailability.date, func.count(RoomAvailability.id)).filter(
+        RoomAvailability.hotel_id == hotel_id,
+        RoomAvailability.is_available == False
+    ).group_by(RoomAvailability.date).all()
+    if counts:
+        db.session.execute(
+            HotelOccupancy.__table__.insert(),
+            [{'hotel_id': hotel_id, 'date': night, 'booked_rooms': count} for night, count in counts]
+        )
+
+
+def available_tonight(hotel):
+    """
+    Get the hotel's available rooms for tonight, for display
+
+    A stored figure from an earlier night is recomputed but not written back;
+    bookings, cancellations and the nightly refresh keep it up to date.
+    """
+    today = date.today()
+    if hotel.availability_date == today:
+        return hotel.available_rooms
+    return max(0, (hotel.total_rooms or 0) - max_booked_rooms(hotel.id, today, today + timedelta(days=1)))
+
+
+def adjust_availability(hotel, nights, delta):
+    """
+    Apply a booking or cancellation to the hotel's available_rooms for tonight
+
+    Only tonight's change is applied, as a relative UPDATE in the caller's
+    transaction; nothing is counted. A figure left over from an earlier day is
+    recomputed from tonight's occupancy counter instead, so call this after
+    adjust_occupancy().
+
+    Args:
+        hotel (Hotel): The hotel booked or cancelled
+        nights (iterable): Dates of the booked or released nights
+        delta (int): +1 per night for a booking, -1 per night for a cancellation
+    """
+    today = date.today()
+    if hotel.availability_date != today:
+        hotel.update_availability()
+        return
+
+    rooms = sum(1 for night in nights if night == today) * delta
+    if not rooms:
+        return
+    remaining = Hotel.available_rooms - rooms
+    hotel.available_rooms = case(
+        (remaining < 0, 0),
+        (remaining > Hotel.total_rooms, Hotel.total_rooms),
+        else_=remaining
+    )
+    hotel.last_updated = datetime.utcnow()
@@ -1,13 +1,47 @@
 import os
+import re
 import json
 import logging
-from openai import OpenAI
+
+from utils import answer_cache
+from utils.cache import normalize_location
+from utils.chat_context import CHAT_SUMMARY_TOKENS, build_context, truncate_tokens
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.metrics import count_fallback
+from utils.recommendation_cache import async_get_cached_recommendations, get_cached_recommendations
+from utils.singleflight import async_single_flight, single_flight
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai = OpenAI(api_key=OPENAI_API_KEY)
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "20"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful travel assistant in a travel companion app. "
+    "Provide personalized travel advice, recommendations, and answers to travel-related questions. "
+    "Be conversational, informative, and concise. Focus primarily on travel topics "
+    "such as destinations, accommodations, transportation, activities, budgeting, and travel tips. "
+    "Your responses should be friendly and helpful, formatted in a way that's easy to read."
+)
+
+# Fail fast to the fallback generators while OpenAI is erroring
+openai_breaker = CircuitBreaker(
+    'openai',
+    failure_threshold=int(os.environ.get("OPENAI_BREAKER_FAILURES", "5")),
+    recovery_timeout=float(os.environ.get("OPENAI_BREAKER_RESET", "30"))
+)
+
+_openai = None
+
+def get_openai():
+    """Return the OpenAI client, creating it on first use"""
+    global _openai
+    if _openai is None:
+        from openai import OpenAI
+        _openai = OpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+    return _openai
 
 def get_hotel_recommendations(destination, budget, num_results=5):
     """
@@ -26,46 +60,12 @@ def get_hotel_recommendations(destination, budget, num_results=5):
         return None
     
     try:
-        prompt = f"""
-        I need hotel recommendations for travelers visiting {destination} with a budget of ${budget} per night.
-        
-        Please provide {num_results} hotel recommendations in the following JSON format:
-        [
-            {{
-                "id": 1,
-                "name": "Hotel Name",
-                "location": "Exact location within {destination}",
-                "price": 120.00,
-                "rating": 4.5,
-                "features": ["Feature 1", "Feature 2", "Feature 3"],
-                "description": "Brief description of the hotel"
-            }},
-            ...
-        ]
-        
-        Make sure to stay under the budget of ${budget} per night and provide realistic hotel names,
-        locations, and details. Each hotel should have a unique ID and valid rating out of 5.
-        """
-        
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a travel expert providing helpful hotel recommendations."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        
-        # Check if result is a dict with a list inside, which can happen sometimes
-        if isinstance(result, dict) and any(key in result for key in ["hotels", "recommendations", "results"]):
-            for key in ["hotels", "recommendations", "results"]:
-                if key in result:
-                    return result[key]
+        # Served from the recommendation cache when another search in the same
+        # destination and budget band ran recently
+        return get_cached_recommendations(destination, budget, num_results, _request_hotel_recommendations)
         
-        # Otherwise, return the direct list
-        return result
+    except CircuitOpenError:
+        return get_fallback_hotel_recommendations(destination, budget, num_results)
         
     except Exception as e:
         logging.error(f"Error getting hotel recommendations: {e}")
@@ -73,6 +73,58 @@ def get_hotel_recommendations(destination, budget, num_results=5):
         # If we hit an API quota limit or any other error, provide fallback recommendations
         return get_fallback_hotel_recommendations(destination, budget, num_results)
 
+@single_flight(lambda destination, budget, num_results: (normalize_location(destination), float(budget), num_results))
+def _request_hotel_recommendations(destination, budget, num_results):
+    """Ask ChatGPT for hotel recommendations; errors are left to the caller"""
+    response = openai_breaker.call(
+        get_openai().chat.completions.create,
+        **_hotel_completion_args(destination, budget, num_results)
+    )
+    return _parse_hotel_recommendations(response.choices[0].message.content)
+
+def _hotel_completion_args(destination, budget, num_results):
+    prompt = f"""
+    I need hotel recommendations for travelers visiting {destination} with a budget of ${budget} per night.
+    
+    Please provide {num_results} hotel recommendations in the following JSON format:
+    [
+        {{
+            "id": 1,
+            "name": "Hotel Name",
+            "location": "Exact location within {destination}",
+            "price": 120.00,
+            "rating": 4.5,
+            "features": ["Feature 1", "Feature 2", "Feature 3"],
+            "description": "Brief description of the hotel"
+        }},
+        ...
+    ]
+    
+    Make sure to stay under the budget of ${budget} per night and provide realistic hotel names,
+    locations, and details. Each hotel should have a unique ID and valid rating out of 5.
+    """
+    
+    return dict(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a travel expert providing helpful hotel recommendations."},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"}
+    )
+
+def _parse_hotel_recommendations(content):
+    result = json.loads(content)
+    
+    # Check if result is a dict with a list inside, which can happen sometimes
+    if isinstance(result, dict) and any(key in result for key in ["hotels", "recommendations", "results"]):
+        for key in ["hotels", "recommendations", "results"]:
+            if key in result:
+                return result[key]
+    
+    # Otherwise, return the direct list
+    return result
+
 def get_fallback_hotel_recommendations(destination, budget, num_results=5):
     """
     Provides fallback hotel recommendations when the OpenAI API is unavailable
@@ -86,6 +138,7 @@ def get_fallback_hotel_recommendations(destination, budget, num_results=5):
         list: A list of dictionaries containing hotel recommendations
     """
     logging.info(f"Using fallback recommendations for {destination}")
+    count_fallback('openai', 'hotels')
     
     # Generate a deterministic but seemingly random set of hotels based on the destination
     import hashlib
@@ -131,20 +184,23 @@ def get_fallback_hotel_recommendations(destination, budget, num_results=5):
             "price": price,
             "rating": rating,
             "features": features_options[feature_index],
-            "description": f"A comfortable stay in the heart of {destination} with modern amenities and excellent service. Located near major attractions and transport options."
+            "description": f"A comfortable stay in the heart of {destination} with modern amenities and excellent service. Located near major attractions and transport options.",
+            # Made up, so never stored or offered for booking
+            "fallback": True
         }
         
         fallback_hotels.append(hotel)
     
     return fallback_hotels
 
-def get_chat_response(message, conversation_history=None):
+def get_chat_response(message, conversation_history=None, summary=None):
     """
     Use ChatGPT to respond to user messages in the travel assistant chat
     
     Args:
         message (str): The user's message
-        conversation_history (list, optional): A list of previous messages in the conversation
+        conversation_history (list, optional): Previous messages, not including this one
+        summary (str, optional): Rolling summary of turns no longer kept in the history
         
     Returns:
         str: The AI assistant's response
@@ -153,40 +209,233 @@ def get_chat_response(message, conversation_history=None):
         logging.error("OpenAI API key not found")
         return "I'm sorry, but I'm not available at the moment. Please try again later."
     
+    # Context-free questions can reuse the answer to a near-identical one
+    cacheable = answer_cache.is_cacheable(conversation_history, summary)
+    if cacheable:
+        cached = answer_cache.lookup(message)
+        if cached is not None:
+            return cached
+    
     try:
-        # Initialize messages with system prompt if no history is provided
-        if not conversation_history:
-            messages = [
-                {
-                    "role": "system", 
-                    "content": (
-                        "You are a helpful travel assistant in a travel companion app. "
-                        "Provide personalized travel advice, recommendations, and answers to travel-related questions. "
-                        "Be conversational, informative, and concise. Focus primarily on travel topics "
-                        "such as destinations, accommodations, transportation, activities, budgeting, and travel tips. "
-                        "Your responses should be friendly and helpful, formatted in a way that's easy to read."
-                    )
-                }
-            ]
-        else:
-            messages = conversation_history.copy()
-        
-        # Add the user's message
-        messages.append({"role": "user", "content": message})
+        messages = _build_chat_messages(message, conversation_history, summary)
         
         # Get a response from the model
-        response = openai.chat.completions.create(
+        response = openai_breaker.call(
+            get_openai().chat.completions.create,
             model="gpt-4o",
             messages=messages,
             max_tokens=500
         )
         
-        return response.choices[0].message.content
+        answer = response.choices[0].message.content
+        if cacheable:
+            answer_cache.store(message, answer)
+        return answer
+        
+    except CircuitOpenError:
+        return get_fallback_chat_response(message)
         
     except Exception as e:
         logging.error(f"Error getting chat response: {e}")
         return get_fallback_chat_response(message)
 
+def _build_chat_messages(message, conversation_history=None, summary=None):
+    """Build the message list sent to the model, fitted to the CHAT_CONTEXT_TOKENS budget"""
+    return build_context(CHAT_SYSTEM_PROMPT, summary, conversation_history, message)
+
+def _summary_messages(summary, messages):
+    transcript = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a conversation between a traveler and a travel assistant. "
+                "Merge the earlier summary with the new turns. Keep destinations, dates, budgets, preferences, "
+                f"and decisions made; drop small talk. Reply with the summary only, under {CHAT_SUMMARY_TOKENS} tokens."
+            )
+        },
+        {"role": "user", "content": f"Earlier summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"}
+    ]
+
+def summarize_conversation(summary, messages):
+    """
+    Fold older chat messages into the conversation's rolling summary
+    
+    Args:
+        summary (str): The current summary, may be empty
+        messages (list): Messages leaving the stored history, oldest first
+        
+    Returns:
+        str: The updated summary
+    """
+    if OPENAI_API_KEY:
+        try:
+            response = openai_breaker.call(
+                get_openai().chat.completions.create,
+                model="gpt-4o",
+                messages=_summary_messages(summary, messages),
+                max_tokens=CHAT_SUMMARY_TOKENS
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logging.error(f"Error summarizing conversation: {e}")
+    return get_fallback_summary(summary, messages)
+
+def get_fallback_summary(summary, messages):
+    """Summarize without the API by keeping the opening sentence of each message"""
+    count_fallback('openai', 'summary')
+    lines = [summary] if summary else []
+    for m in messages:
+        first = re.split(r"(?<=[.!?])\s", m["content"].strip(), maxsplit=1)[0]
+        lines.append(f"{m['role'].capitalize()}: {first}")
+    return truncate_tokens("\n".join(lines), CHAT_SUMMARY_TOKENS)
+
+def _stream_text(text):
+    """Yield a complete text word by word so fallback replies stream like model output"""
+    for piece in re.findall(r"\S+\s*", text):
+        yield piece
+
+def stream_chat_response(message, conversation_history=None, summary=None):
+    """
+    Stream the travel assistant's reply as it is generated
+    
+    Args:
+        message (str): The user's message
+        conversation_history (list, optional): Previous messages, not including this one
+        summary (str, optional): Rolling summary of turns no longer kept in the history
+        
+    Yields:
+        str: Pieces of the reply, in order
+    """
+    if not OPENAI_API_KEY:
+        logging.error("OpenAI API key not found")
+        yield "I'm sorry, but I'm not available at the moment. Please try again later."
+        return
+    
+    cacheable = answer_cache.is_cacheable(conversation_history, summary)
+    if cacheable:
+        cached = answer_cache.lookup(message)
+        if cached is not None:
+            yield from _stream_text(cached)
+            return
+    
+    if not openai_breaker.allow_request():
+        yield from _stream_text(get_fallback_chat_response(message))
+        return
+    
+    pieces = []
+    failed = False
+    try:
+        stream = get_openai().chat.completions.create(
+            model="gpt-4o",
+            messages=_build_chat_messages(message, conversation_history, summary),
+            max_tokens=500,
+            stream=True
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                pieces.append(delta)
+                yield delta
+        
+        if cacheable:
+            answer_cache.store(message, ''.join(pieces))
+        
+    except Exception as e:
+        failed = True
+        openai_breaker.record_failure()
+        logging.error(f"Error streaming chat response: {e}")
+        if not pieces:
+            yield from _stream_text(get_fallback_chat_response(message))
+    
+    finally:
+        # Also runs when the client disconnects mid-stream, so a half-open
+        # breaker's trial call is always accounted for
+        if not failed:
+            openai_breaker.record_success()
+
+# Async variants for the ASGI serving mode (see asgi.py)
+
+_async_openai = None
+
+def get_async_openai():
+    """Return the AsyncOpenAI client, creating it on first use"""
+    global _async_openai
+    if _async_openai is None:
+        from openai import AsyncOpenAI
+        _async_openai = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+    return _async_openai
+
+async def async_get_hotel_recommendations(destination, budget, num_results=5):
+    """Async version of get_hotel_recommendations()"""
+    if not OPENAI_API_KEY:
+        logging.error("OpenAI API key not found")
+        return None
+    
+    try:
+        return await async_get_cached_recommendations(destination, budget, num_results, _async_request_hotel_recommendations)
+        
+    except CircuitOpenError:
+        return get_fallback_hotel_recommendations(destination, budget, num_results)
+        
+    except Exception as e:
+        logging.error(f"Error getting hotel recommendations: {e}")
+        return get_fallback_hotel_recommendations(destination, budget, num_results)
+
+@async_single_flight(lambda destination, budget, num_results: (normalize_location(destination), float(budget), num_results))
+async def _async_request_hotel_recommendations(destination, budget, num_results):
+    response = await openai_breaker.call_async(
+        get_async_openai().chat.completions.create,
+        **_hotel_completion_args(destination, budget, num_results)
+    )
+    return _parse_hotel_recommendations(response.choices[0].message.content)
+
+async def async_get_chat_response(message, conversation_history=None, summary=None):
+    """Async version of get_chat_response()"""
+    if not OPENAI_API_KEY:
+        logging.error("OpenAI API key not found")
+        return "I'm sorry, but I'm not available at the moment. Please try again later."
+    
+    cacheable = answer_cache.is_cacheable(conversation_history, summary)
+    if cacheable:
+        cached = answer_cache.lookup(message)
+        if cached is not None:
+            return cached
+    
+    try:
+        response = await openai_breaker.call_async(
+            get_async_openai().chat.completions.create,
+            model="gpt-4o",
+            messages=_build_chat_messages(message, conversation_history, summary),
+            max_tokens=500
+        )
+        answer = response.choices[0].message.content
+        if cacheable:
+            answer_cache.store(message, answer)
+        return answer
+        
+    except CircuitOpenError:
+        return get_fallback_chat_response(message)
+        
+    except Exception as e:
+        logging.error(f"Error getting chat response: {e}")
+        return get_fallback_chat_response(message)
+
+async def async_summarize_conversation(summary, messages):
+    """Async version of summarize_conversation()"""
+    if OPENAI_API_KEY:
+        try:
+            response = await openai_breaker.call_async(
+                get_async_openai().chat.completions.create,
+                model="gpt-4o",
+                messages=_summary_messages(summary, messages),
+                max_tokens=CHAT_SUMMARY_TOKENS
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logging.error(f"Error summarizing conversation: {e}")
+    return get_fallback_summary(summary, messages)
+
 def get_fallback_chat_response(message):
     """
     Provides fallback responses when the OpenAI API is unavailable
@@ -197,6 +446,7 @@ def get_fallback_chat_response(message):
     Returns:
         str: A fallback response
     """
+    count_fallback('openai', 'chat')
     # Extract some key travel-related keywords for basic pattern matching
     message_lower = message.lower()
     
@@ -0,0 +1,171 @@
+import io
+import os
+import re
+import time
+import random
+import pstats
+import logging
+import cProfile
+import functools
+import contextvars
+from collections import Counter
+
+import click
+from flask import request
+from flask.cli import AppGroup
+
+# Opt-in: profile a sample of requests and check every request for repeated SQL.
+# PROFILE_SAMPLE_RATE=0 keeps only the repeated-query check.
+PROFILING = os.environ.get("PROFILING", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "instance/profiles")
+# Admins can profile a single request by sending this header, even with PROFILING off
+PROFILE_HEADER = os.environ.get("PROFILE_HEADER", "X-Profile")
+# Statements of the same shape one request may run before it is logged
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", "10"))
+
+# [profiler or None, Counter of statement shapes, started] for the request being handled
+_request_profile = contextvars.ContextVar('request_profile', default=None)
+
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+|\$\d+))*\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def statement_shape(statement):
+    """
+    Reduce a SQL statement to its shape, so near-identical statements compare equal
+
+    Literals become ?, expanded IN lists become (?...) and whitespace is
+    collapsed, e.g. a COUNT per room and one per hotel share a shape.
+    """
+    shape = _LITERAL.sub('?', statement)
+    shape = _IN_LIST.sub('(?...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def _profile_path(endpoint, elapsed):
+    directory = os.path.join(PROFILE_DIR, endpoint)
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    return os.path.join(directory, f"{stamp}-{os.getpid()}-{int(elapsed * 1000)}ms.prof")
+
+
+def _start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process
+        return None
+    return profiler
+
+
+def init_app(app, allow_header=None):
+    """
+    Register the profiling and repeated-query hooks
+
+    Args:
+        app (Flask): The application
+        allow_header (callable, optional): Returns whether the current user may
+            profile a request with PROFILE_HEADER; the header is ignored without it
+    """
+    def before_request():
+        profiler = None
+        requested = allow_header is not None and request.headers.get(PROFILE_HEADER) and allow_header()
+        if requested or (PROFILING and random.random() < PROFILE_SAMPLE_RATE):
+            profiler = _start_profiler()
+        if PROFILING or requested:
+            _request_profile.set([profiler, Counter(), time.perf_counter()])
+
+    def after_request(response):
+        state = _request_profile.get()
+        if state is None:
+            return response
+        _request_profile.set(None)
+        profiler, shapes, started = state
+        endpoint = request.endpoint or 'unmatched'
+
+        if profiler is not None:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            try:
+                path = _profile_path(endpoint, elapsed)
+                profiler.dump_stats(path)
+                logging.info(f"Profiled {request.method} {request.path} ({elapsed * 1000:.0f} ms) to {path}")
+            except OSError as e:
+                logging.error(f"Error writing profile for {endpoint}: {e}")
+
+        for shape, count in shapes.items():
+            if count >= QUERY_REPEAT_THRESHOLD:
+                logging.warning(f"Repeated SQL on {endpoint}: {count} statements shaped like {shape[:300]}")
+        return response
+
+    app.before_request(before_request)
+    app.after_request(after_request)
+    _listen()
+
+
+_listening = False
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _request_profile.get()
+    if state is not None:
+        state[1][statement_shape(statement)] += 1
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+def load_profiles(endpoint):
+    """
+    Merge every profile written for an endpoint
+
+    Returns:
+        tuple: (pstats.Stats or None, number of profile files)
+    """
+    directory = os.path.join(PROFILE_DIR, endpoint)
+    files = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.prof'))
+    if not files:
+        return None, 0
+    stats = pstats.Stats(files[0], stream=io.StringIO())
+    for path in files[1:]:
+        stats.add(path)
+    return stats, len(files)
+
+
+profile_cli = AppGroup('profile', help='Request profiles written by the profiling hooks.')
+
+
+@profile_cli.command('report')
+@click.argument('endpoint', required=False)
+@click.option('--sort', default='cumulative', show_default=True, help='pstats sort key.')
+@click.option('--limit', default=30, show_default=True, help='Functions to list.')
+def report_command(endpoint, sort, limit):
+    """Summarize the profiles of ENDPOINT, or list profiled endpoints."""
+    if not os.path.isdir(PROFILE_DIR):
+        raise click.ClickException(f"No profiles in {PROFILE_DIR}")
+    if endpoint is None:
+        for name in sorted(os.listdir(PROFILE_DIR)):
+            directory = os.path.join(PROFILE_DIR, name)
+            if os.path.isdir(directory):
+                count = sum(1 for file in os.listdir(directory) if file.endswith('.prof'))
+                click.echo(f"{name:<40} {count} profiles")
+        return
+    if not os.path.isdir(os.path.join(PROFILE_DIR, endpoint)):
+        raise click.ClickException(f"No profiles for {endpoint}")
+    stats, count = load_profiles(endpoint)
+    if stats is None:
+        raise click.ClickException(f"No profiles for {endpoint}")
+    stats.stream = output = io.StringIO()
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    click.echo(f"{count} profiles of {endpoint}")
+    click.echo(output.getvalue())
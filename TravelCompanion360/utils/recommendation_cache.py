@@ -0,0 +1,198 @@
+import os
+import math
+import asyncio
+import time
+import logging
+import threading
+from collections import Counter
+
+from utils.cache import LRUCache, normalize_location
+
+RECOMMENDATION_CACHE_TTL = int(os.environ.get("RECOMMENDATION_CACHE_TTL", "3600"))
+RECOMMENDATION_STALE_TTL = int(os.environ.get("RECOMMENDATION_STALE_TTL", "86400"))
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get("RECOMMENDATION_CACHE_SIZE", "512"))
+RECOMMENDATION_BUDGET_BAND = float(os.environ.get("RECOMMENDATION_BUDGET_BAND", "25"))
+
+_cache = LRUCache(maxsize=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def budget_bucket(budget):
+    """Round a budget up to the top of its band, e.g. $130 -> $150 with $25 bands"""
+    return math.ceil(float(budget) / RECOMMENDATION_BUDGET_BAND) * RECOMMENDATION_BUDGET_BAND
+
+
+def filter_to_budget(hotels, budget):
+    """Keep only hotels whose nightly price is within the exact budget"""
+    within = []
+    for hotel in hotels or []:
+        try:
+            price = float(hotel.get("price", 0))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if price <= budget:
+            within.append(hotel)
+    return within
+
+
+def _exact_key(destination, budget, num_results):
+    """Key for recommendations fetched for an exact budget, apart from the band entries"""
+    return (normalize_location(destination), 'exact', float(budget), num_results)
+
+
+def _refresh(key, fetch, destination, bucket, num_results):
+    try:
+        _cache.set(key, fetch(destination, bucket, num_results))
+        _count('refreshes')
+    except Exception as e:
+        logging.error(f"Background refresh of hotel recommendations for {destination} failed: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _refresh_in_background(key, fetch, destination, bucket, num_results):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    threading.Thread(
+        target=_refresh,
+        args=(key, fetch, destination, bucket, num_results),
+        daemon=True
+    ).start()
+
+
+def get_cached_recommendations(destination, budget, num_results, fetch):
+    """
+    Return hotel recommendations for a destination and budget, using the cache
+
+    Entries are keyed by normalized destination and budget band and fetched
+    for the top of the band, so every budget in the band shares them. When
+    nothing in the band fits the exact budget, recommendations for that
+    budget are fetched and cached under their own key, which is checked
+    first. An expired entry is still served for up to
+    RECOMMENDATION_STALE_TTL seconds while a background thread refreshes it.
+
+    Args:
+        destination (str): The destination city or location
+        budget (float): Maximum price per night in USD
+        num_results (int): Number of hotel recommendations to request
+        fetch (callable): fetch(destination, budget, num_results) returning a
+            list of hotels; exceptions propagate on a cache miss
+
+    Returns:
+        list: Recommendations priced within the exact budget
+    """
+    exact_key = _exact_key(destination, budget, num_results)
+    state, hotels = _lookup(exact_key, count_miss=False)
+    if state != 'miss':
+        if state == 'stale':
+            _refresh_in_background(exact_key, fetch, destination, budget, num_results)
+        return filter_to_budget(hotels, budget)
+
+    bucket = budget_bucket(budget)
+    key = (normalize_location(destination), bucket, num_results)
+
+    state, hotels = _lookup(key)
+    if state == 'stale':
+        _refresh_in_background(key, fetch, destination, bucket, num_results)
+    elif state == 'miss':
+        hotels = fetch(destination, bucket, num_results)
+        _cache.set(key, hotels)
+
+    within = filter_to_budget(hotels, budget)
+    if not within and hotels:
+        # Nothing in the band is cheap enough; ask again for the exact budget
+        _count('exact_fetches')
+        hotels = fetch(destination, budget, num_results)
+        _cache.set(exact_key, hotels)
+        within = filter_to_budget(hotels, budget)
+    return within
+
+
+async def async_get_cached_recommendations(destination, budget, num_results, fetch):
+    """
+    Async version of get_cached_recommendations(); ``fetch`` is a coroutine function
+
+    Stale entries are refreshed in a task on the running event loop.
+    """
+    exact_key = _exact_key(destination, budget, num_results)
+    state, hotels = _lookup(exact_key, count_miss=False)
+    if state != 'miss':
+        if state == 'stale':
+            _async_refresh_in_background(exact_key, fetch, destination, budget, num_results)
+        return filter_to_budget(hotels, budget)
+
+    bucket = budget_bucket(budget)
+    key = (normalize_location(destination), bucket, num_results)
+
+    state, hotels = _lookup(key)
+    if state == 'stale':
+        _async_refresh_in_background(key, fetch, destination, bucket, num_results)
+    elif state == 'miss':
+        hotels = await fetch(destination, bucket, num_results)
+        _cache.set(key, hotels)
+
+    within = filter_to_budget(hotels, budget)
+    if not within and hotels:
+        _count('exact_fetches')
+        hotels = await fetch(destination, budget, num_results)
+        _cache.set(exact_key, hotels)
+        within = filter_to_budget(hotels, budget)
+    return within
+
+
+def _async_refresh_in_background(key, fetch, destination, budget, num_results):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    asyncio.ensure_future(_async_refresh(key, fetch, destination, budget, num_results))
+
+
+async def _async_refresh(key, fetch, destination, budget, num_results):
+    try:
+        _cache.set(key, await fetch(destination, budget, num_results))
+        _count('refreshes')
+    except Exception as e:
+        logging.error(f"Background refresh of hotel recommendations for {destination} failed: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _lookup(key, count_miss=True):
+    """
+    Classify a cache entry as fresh, stale (servable while refreshing) or missing
+
+    Returns:
+        tuple: ('hit' | 'stale' | 'miss', cached hotels or None)
+    """
+    entry = _cache.peek(key)
+    now = time.monotonic()
+    if entry is not None and entry[1] > now:
+        _count('hits')
+        return 'hit', entry[0]
+    if entry is not None and entry[1] + RECOMMENDATION_STALE_TTL > now:
+        _count('stale_hits')
+        return 'stale', entry[0]
+    if count_miss:
+        _count('misses')
+    return 'miss', None
+
+
+def get_cache_stats():
+    """Return hit/miss counters for the recommendation cache in this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['size'] = len(_cache)
+    return stats
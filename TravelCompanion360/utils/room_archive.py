@@ -0,0 +1,141 @@
+import logging
+from datetime import date, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, func, select, update
+
+from db import db
+from models import Hotel, HotelOccupancy, RoomAvailability, RoomNightArchive
+
+# Rows deleted per statement, to stay under database parameter limits
+ARCHIVE_DELETE_CHUNK = 500
+
+
+def compact_nights(rows):
+    """
+    Fold booked room-nights into runs of consecutive nights
+
+    Args:
+        rows (iterable): Objects with booking_id, room_number and date
+
+    Returns:
+        list: Dicts of booking_id, room_number, first_night and nights
+    """
+    runs = []
+    ordered = sorted(rows, key=lambda r: (r.booking_id or 0, r.room_number or 0, r.date))
+    for row in ordered:
+        last = runs[-1] if runs else None
+        if (last and last['booking_id'] == row.booking_id and last['room_number'] == row.room_number
+                and last['first_night'] + timedelta(days=last['nights']) == row.date):
+            last['nights'] += 1
+        else:
+            runs.append({'booking_id': row.booking_id, 'room_number': row.room_number, 'first_night': row.date, 'nights': 1})
+    return runs
+
+
+def archive_hotel_nights(hotel_id, before):
+    """
+    Move a hotel's room-nights before a date out of room_availability
+
+    Booked nights are written to room_night_archive as runs; free rows are
+    dropped. The hotel's nightly counters for those dates go too, so both hot
+    tables only cover the booking horizon. Runs in the caller's transaction.
+
+    Returns:
+        tuple: (room-night rows removed, archive rows written)
+    """
+    rows = db.session.execute(
+        select(RoomAvailability.id, RoomAvailability.booking_id, RoomAvailability.room_number,
+               RoomAvailability.date, RoomAvailability.is_available).where(
+            RoomAvailability.hotel_id == hotel_id,
+            RoomAvailability.date < before
+        )
+    ).all()
+    if not rows:
+        return 0, 0
+
+    runs = compact_nights(row for row in rows if not row.is_available)
+    if runs:
+        db.session.execute(RoomNightArchive.__table__.insert(), [dict(run, hotel_id=hotel_id) for run in runs])
+
+    ids = [row.id for row in rows]
+    for start in range(0, len(ids), ARCHIVE_DELETE_CHUNK):
+        db.session.execute(
+            RoomAvailability.__table__.delete().where(RoomAvailability.id.in_(ids[start:start + ARCHIVE_DELETE_CHUNK]))
+        )
+    db.session.execute(
+        HotelOccupancy.__table__.delete().where(HotelOccupancy.hotel_id == hotel_id, HotelOccupancy.date < before)
+    )
+    return len(rows), len(runs)
+
+
+def archive_past_nights(before=None):
+    """
+    Archive every hotel's room-nights before a date, committing per hotel
+
+    Args:
+        before (date, optional): First night to keep; defaults to today
+
+    Returns:
+        dict: Counts of hotels, room-night rows removed and archive rows written
+    """
+    before = before or date.today()
+    hotel_ids = db.session.scalars(
+        select(RoomAvailability.hotel_id).where(RoomAvailability.date < before).distinct()
+    ).all()
+
+    totals = {'hotels': 0, 'nights': 0, 'archived': 0}
+    for hotel_id in hotel_ids:
+        try:
+            nights, archived = archive_hotel_nights(hotel_id, before)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error archiving room-nights for hotel {hotel_id}: {e}")
+            continue
+        totals['hotels'] += 1
+        totals['nights'] += nights
+        totals['archived'] += archived
+    return totals
+
+
+def refresh_all_availability():
+    """
+    Point every hotel's available_rooms at tonight in one UPDATE
+
+    Meant to run just after midnight; hotels that are not refreshed here are
+    recomputed on their next booking, cancellation or availability view.
+
+    Returns:
+        int: Number of hotels updated
+    """
+    today = date.today()
+    booked = select(HotelOccupancy.booked_rooms).where(
+        HotelOccupancy.hotel_id == Hotel.id,
+        HotelOccupancy.date == today
+    ).scalar_subquery()
+    remaining = func.coalesce(Hotel.total_rooms, 0) - func.coalesce(booked, 0)
+    result = db.session.execute(
+        update(Hotel).values(available_rooms=case((remaining < 0, 0), else_=remaining), availability_date=today),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+rooms_cli = AppGroup('rooms', help='Room availability maintenance.')
+
+
+@rooms_cli.command('archive')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), help='First night to keep (default today).')
+def archive_command(before):
+    """Move past room-nights into room_night_archive."""
+    totals = archive_past_nights(before.date() if before else None)
+    click.echo(f"Archived {totals['nights']} room-nights from {totals['hotels']} hotels into {totals['archived']} rows")
+
+
+@rooms_cli.command('refresh-availability')
+def refresh_availability_command():
+    """Recompute every hotel's available rooms for tonight."""
+    click.echo(f"Refreshed {refresh_all_availability()} hotels")
@@ -0,0 +1,362 @@
+import os
+import logging
+import functools
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import has_app_context
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+
+from db import db, dialect_insert
+from models import ServerSession
+from utils.cache import LRUCache
+
+# Where session data lives: 'memory' (single process), 'database' or 'file' (shared by workers on one host)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "database")
+SESSION_MEMORY_SIZE = int(os.environ.get("SESSION_MEMORY_SIZE", "10000"))
+SESSION_FILE = os.environ.get("SESSION_FILE", "instance/sessions.db")
+# Expired sessions are purged after this many writes
+SESSION_PURGE_EVERY = int(os.environ.get("SESSION_PURGE_EVERY", "1000"))
+# A session that is only read has its expiry pushed back at most this often (seconds)
+SESSION_REFRESH_EVERY = int(os.environ.get("SESSION_REFRESH_EVERY", "3600"))
+
+
+class ServerSideSession(SessionMixin):
+    """
+    Session whose data is fetched from the backend the first time it is used
+
+    Requests that never touch the session never read the backend, and only
+    changed sessions are written back.
+    """
+
+    def __init__(self, sid=None, loader=None):
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self._loader = loader
+        self._data = None if loader else {}
+        # Seconds the stored session had left when it was loaded
+        self.ttl_left = None
+        # Id this session was stored under before regenerate(), deleted on save
+        self.replaced_sid = None
+
+    @property
+    def data(self):
+        self.accessed = True
+        if self._data is None:
+            loaded = self._loader(self.sid)
+            self._loader = None
+            if loaded is None:
+                # Unknown or expired id: never reuse an id the client picked
+                self._data = {}
+                self.sid = None
+                self.new = True
+            else:
+                self._data, self.ttl_left = loaded
+        return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def clear(self):
+        self.data.clear()
+        self.modified = True
+
+    def regenerate(self):
+        """Move the data to a new id, so an id known before login or logout stops working"""
+        # Loading first drops an id the backend doesn't know
+        self.data
+        if self.sid is not None:
+            self.replaced_sid = self.replaced_sid or self.sid
+        self.sid = None
+        self.new = True
+        self.modified = True
+
+
+class MemorySessionBackend:
+    """In-process LRU store; sessions are lost on restart and not shared between workers"""
+
+    def __init__(self, maxsize=SESSION_MEMORY_SIZE):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def load(self, sid):
+        data = self._cache.get(sid)
+        if data is None:
+            return None
+        entry = self._cache.peek(sid)
+        return data, (entry[1] - time.monotonic() if entry and entry[1] is not None else None)
+
+    def save(self, sid, data, ttl):
+        self._cache.set(sid, data, ttl=ttl)
+
+    def touch(self, sid, ttl):
+        data = self._cache.get(sid)
+        if data is not None:
+            self._cache.set(sid, data, ttl=ttl)
+
+    def delete(self, sid):
+        self._cache.pop(sid)
+
+
+class DatabaseSessionBackend:
+    """Stores sessions in the server_session table, on connections separate from the request's"""
+
+    def __init__(self):
+        self._writes = 0
+
+    def load(self, sid):
+        table = ServerSession.__table__
+        now = datetime.utcnow()
+        with db.engine.connect() as conn:
+            row = conn.execute(table.select().where(
+                (table.c.sid == sid) & (table.c.expires_at > now)
+            )).first()
+        if row is None:
+            return None
+        return session_json_serializer.loads(row.data), (row.expires_at - now).total_seconds()
+
+    def save(self, sid, data, ttl):
+        values = {
+            'sid': sid,
+            'data': session_json_serializer.dumps(data),
+            'expires_at': datetime.utcnow() + timedelta(seconds=ttl)
+        }
+        with db.engine.begin() as conn:
+            stmt = dialect_insert(ServerSession)
+            if stmt is not None:
+                stmt = stmt.values(values)
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=[ServerSession.sid],
+                    set_={k: stmt.excluded[k] for k in ('data', 'expires_at')}
+                ))
+            else:
+                table = ServerSession.__table__
+                conn.execute(table.delete().where(table.c.sid == sid))
+                conn.execute(table.insert().values(values))
+
+        self._writes += 1
+        if self._writes % SESSION_PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def touch(self, sid, ttl):
+        table = ServerSession.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.sid == sid).values(
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+            ))
+
+    def delete(self, sid):
+        table = ServerSession.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.sid == sid))
+
+    def purge_expired(self):
+        table = ServerSession.__table__
+        with db.engine.begin() as conn:
+            return conn.execute(table.delete().where(table.c.expires_at <= datetime.utcnow())).rowcount
+
+
+class FileSessionBackend:
+    """
+    Stores sessions in a local SQLite key-value file
+
+    Works for several workers on one host without touching the main database.
+    """
+
+    def __init__(self, path=SESSION_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        # Opened on first use in each thread, so no connection is shared across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?", (sid, now)
+        ).fetchone()
+        return (session_json_serializer.loads(row[0]), row[1] - now) if row is not None else None
+
+    def save(self, sid, data, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+                (sid, session_json_serializer.dumps(data), time.time() + ttl)
+            )
+        self._writes += 1
+        if self._writes % SESSION_PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def touch(self, sid, ttl):
+        with self._connect() as conn:
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (time.time() + ttl, sid))
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+BACKENDS = {
+    'memory': MemorySessionBackend,
+    'database': DatabaseSessionBackend,
+    'file': FileSessionBackend,
+}
+
+
+def regenerate_session():
+    """
+    Give the current session a new id, keeping its data
+
+    Call on login and logout to prevent session fixation: the old id is
+    deleted from the backend when the response is saved.
+    """
+    from flask import session
+
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+def create_session_backend(name=None):
+    """Create the session backend named by SESSION_BACKEND"""
+    name = name or SESSION_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown SESSION_BACKEND '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Keep session data in a server-side backend and only its id in the cookie
+
+    Data is loaded lazily and written back only when the session changed.
+    A session that is only read has its expiry extended, at most once every
+    SESSION_REFRESH_EVERY seconds, so active users stay logged in.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _load(self, app, sid):
+        if not has_app_context():
+            # e.g. the test client's session_transaction(), used outside the request
+            with app.app_context():
+                return self._load(app, sid)
+        try:
+            return self.backend.load(sid)
+        except Exception as e:
+            logging.error(f"Error loading session: {e}")
+            return None
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSideSession()
+        return ServerSideSession(sid, loader=functools.partial(self._load, app))
+
+    def _set_cookie(self, app, session, response):
+        response.set_cookie(
+            self.get_cookie_name(app),
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def _refresh(self, app, session, response, ttl):
+        """Push back the expiry of a session that was read but not changed"""
+        if session.sid is None or session.new or session.ttl_left is None:
+            return
+        if ttl - session.ttl_left < SESSION_REFRESH_EVERY:
+            return
+        try:
+            self.backend.touch(session.sid, ttl)
+        except Exception as e:
+            logging.error(f"Error refreshing session: {e}")
+            return
+        if session.permanent:
+            self._set_cookie(app, session, response)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        if not session.modified:
+            if session.loaded and session.data:
+                self._refresh(app, session, response, ttl)
+            return
+
+        if session.replaced_sid:
+            try:
+                self.backend.delete(session.replaced_sid)
+            except Exception as e:
+                logging.error(f"Error deleting replaced session: {e}")
+
+        if not session.loaded or not session.data:
+            # Cleared (e.g. on logout): forget it on both sides
+            if session.sid or session.replaced_sid:
+                if session.sid:
+                    self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+
+        try:
+            self.backend.save(session.sid, dict(session.data), ttl)
+        except Exception as e:
+            logging.error(f"Error saving session: {e}")
+            return
+
+        if session.new or session.permanent:
+            self._set_cookie(app, session, response)
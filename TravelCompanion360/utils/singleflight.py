@@ -0,0 +1,188 @@
+import os
+import time
+import asyncio
+import uuid
+import logging
+import functools
+import threading
+from datetime import datetime, timedelta
+
+from flask import has_app_context
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from models import UpstreamLock
+
+# Coordinate identical upstream calls across workers through the upstream_lock table
+SINGLEFLIGHT_SHARED = os.environ.get("SINGLEFLIGHT_SHARED", "0") == "1"
+SINGLEFLIGHT_LOCK_TTL = int(os.environ.get("SINGLEFLIGHT_LOCK_TTL", "30"))
+
+_owner = uuid.uuid4().hex
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+def single_flight(key_func):
+    """
+    Decorate a function so concurrent calls with the same key share one execution
+
+    Args:
+        key_func (callable): Builds the coalescing key from the call's arguments
+    """
+    def decorator(fn):
+        group = SingleFlight()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return group.do(key_func(*args, **kwargs), fn, *args, **kwargs)
+
+        wrapper.flight = group
+        return wrapper
+    return decorator
+
+
+def async_single_flight(key_func):
+    """
+    Decorate a coroutine function so concurrent awaits with the same key share one call
+
+    The asyncio counterpart of single_flight(), for use on a single event loop.
+    """
+    def decorator(fn):
+        in_flight = {}
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs)
+            task = in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                in_flight[key] = task
+                task.add_done_callback(lambda _: in_flight.pop(key, None))
+            # shield() so one caller being cancelled does not cancel the shared call
+            return await asyncio.shield(task)
+
+        return wrapper
+    return decorator
+
+
+def acquire_shared_lock(key, ttl=None):
+    """
+    Try to take a cross-worker lock for an upstream call
+
+    Returns:
+        bool: True if this worker now holds the lock
+    """
+    table = UpstreamLock.__table__
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where((table.c.lock_key == key) & (table.c.expires_at < now)))
+            conn.execute(table.insert().values(
+                lock_key=key,
+                owner=_owner,
+                expires_at=now + timedelta(seconds=ttl or SINGLEFLIGHT_LOCK_TTL)
+            ))
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_shared_lock(key):
+    table = UpstreamLock.__table__
+    with db.engine.begin() as conn:
+        conn.execute(table.delete().where((table.c.lock_key == key) & (table.c.owner == _owner)))
+
+
+def wait_for_shared_lock(key, timeout=None, interval=0.05):
+    """Wait until another worker releases the lock (or it expires); returns False on timeout"""
+    table = UpstreamLock.__table__
+    deadline = time.monotonic() + (timeout or SINGLEFLIGHT_LOCK_TTL)
+    while time.monotonic() < deadline:
+        with db.engine.connect() as conn:
+            held = conn.execute(table.select().where(
+                (table.c.lock_key == key) & (table.c.expires_at >= datetime.utcnow())
+            )).first()
+        if held is None:
+            return True
+        time.sleep(interval)
+    return False
+
+
+def shared_flight(key, fn, recheck):
+    """
+    Run an upstream call at most once across workers
+
+    Only used when SINGLEFLIGHT_SHARED is enabled and a database is available.
+    The worker holding the lock calls ``fn``; the others wait for it and then
+    call ``recheck``, which returns ``(found, result)`` from a shared cache.
+    If the result is not there the waiter calls ``fn`` itself.
+    """
+    if not SINGLEFLIGHT_SHARED or not has_app_context():
+        return fn()
+
+    try:
+        acquired = acquire_shared_lock(key)
+    except Exception as e:
+        logging.error(f"Error taking upstream lock {key}: {e}")
+        return fn()
+
+    if acquired:
+        try:
+            return fn()
+        finally:
+            release_shared_lock(key)
+
+    wait_for_shared_lock(key)
+    found, result = recheck()
+    return result if found else fn()